@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the whole stack (see countries/metrics.py)
+    'countries.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -85,16 +87,91 @@ WSGI_APPLICATION = 'HNG3.wsgi.application'
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": "railway",
-        "USER": "root",
-        "PASSWORD": "uWmIkpfRPBrSgliownAvZeZsuIiveKhR",
-        "HOST": "caboose.proxy.rlwy.net",
-        "PORT": "45994",
+        "ENGINE": os.environ.get("DB_ENGINE", "django.db.backends.mysql"),
+        "NAME": os.environ.get("DB_NAME", "railway"),
+        "USER": os.environ.get("DB_USER", "root"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", "uWmIkpfRPBrSgliownAvZeZsuIiveKhR"),
+        "HOST": os.environ.get("DB_HOST", "caboose.proxy.rlwy.net"),
+        "PORT": os.environ.get("DB_PORT", "45994"),
+        # Keep each worker's connection open between requests instead of reconnecting (TCP,
+        # TLS and auth to a remote server) every time; checked with a cheap query before it
+        # is reused after an idle period, so server-side timeouts don't surface as errors.
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", "1").lower() in ("1", "true", "yes"),
     }
 }
 
-
+# DB_POOL_SIZE > 0 shares at most that many connections between a worker's threads (and
+# async views); requests wait up to DB_POOL_TIMEOUT seconds for a free one. PostgreSQL uses
+# Django's own pool; MySQL and SQLite use the pooled backends in countries/db/. Connections
+# then go back to the pool after each request, so CONN_MAX_AGE no longer applies.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+POOLED_ENGINES = {
+    "django.db.backends.mysql": "countries.db.mysql",
+    "django.db.backends.sqlite3": "countries.db.sqlite3",
+}
+if DB_POOL_SIZE > 0:
+    _db = DATABASES["default"]
+    _db["CONN_MAX_AGE"] = 0
+    if _db["ENGINE"] == "django.db.backends.postgresql":
+        _db.setdefault("OPTIONS", {})["pool"] = {"max_size": DB_POOL_SIZE, "timeout": DB_POOL_TIMEOUT}
+    else:
+        _db["ENGINE"] = POOLED_ENGINES.get(_db["ENGINE"], _db["ENGINE"])
+        _db["POOL"] = {"SIZE": DB_POOL_SIZE, "TIMEOUT": DB_POOL_TIMEOUT}
+
+
+# External data sources used by POST /countries/refresh. Each may also be a file:// URL or a
+# local path, and UPSTREAM_SNAPSHOT_DIR (a directory holding countries.json and rates.json)
+# replaces both, so refresh can run without network access.
+COUNTRIES_API_URL = os.environ.get(
+    'COUNTRIES_API_URL',
+    'https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies',
+)
+EXCHANGE_RATES_API_URL = os.environ.get('EXCHANGE_RATES_API_URL', 'https://open.er-api.com/v6/latest/USD')
+UPSTREAM_SNAPSHOT_DIR = os.environ.get('UPSTREAM_SNAPSHOT_DIR', '')
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 15))
+# Retries (with exponential backoff) on connection errors and 429/5xx responses
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+UPSTREAM_BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', 0.5))
+# Upstream responses are kept on disk with their ETag/Last-Modified validators. Within the
+# TTL (or before er-api's time_next_update_unix) refresh doesn't contact the source at all;
+# after it, a conditional GET is sent. POST /countries/refresh?force=1 bypasses the cache.
+UPSTREAM_CACHE_DIR = os.environ.get('UPSTREAM_CACHE_DIR', str(BASE_DIR / 'cache' / 'upstream'))
+UPSTREAM_CACHE_TTL = int(os.environ.get('UPSTREAM_CACHE_TTL', 300))
+
+# Background refreshes (POST /countries/refresh?async=1) still queued or running after this
+# many seconds are treated as lost, e.g. because their worker process was restarted.
+REFRESH_JOB_TIMEOUT = int(os.environ.get('REFRESH_JOB_TIMEOUT', 600))
+
+# Per-process cache of rendered GET /countries responses (see countries/cache.py)
+LIST_CACHE_MAX_ENTRIES = int(os.environ.get('LIST_CACHE_MAX_ENTRIES', 128))
+LIST_CACHE_MAX_BYTES = int(os.environ.get('LIST_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Rows fetched and encoded per step by GET /countries?stream=1
+LIST_STREAM_CHUNK_SIZE = int(os.environ.get('LIST_STREAM_CHUNK_SIZE', 500))
+# Cache-Control max-age for country and image responses; clients revalidate with ETags after it
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+
+# POST /countries/bulk: larger bodies or more operations are rejected with 413. Bodies are
+# parsed as they arrive and applied in batches, so memory use doesn't grow with the body.
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', 16 * 1024 * 1024))
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 10000))
+
+# Per-view latency, SQL and cache metrics at /metrics plus a Server-Timing header on responses.
+# Counters are per worker process.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
+# Answer GET /countries, /countries/<name>, /status and /countries/image with native async
+# views (countries/async_views.py). HNG3/asgi.py turns this on; under WSGI it would only add
+# an event loop per request, so it stays off there.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0').lower() in ('1', 'true', 'yes')
+
+# How GET /countries/image sends the file: 'memory' serves bytes cached in each worker (with
+# Range support); 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd) hand the file
+# to the front-end server, which sends it with sendfile(2).
+SUMMARY_IMAGE_SERVE = os.environ.get('SUMMARY_IMAGE_SERVE', 'memory')
+# Internal nginx location that aliases the cache/ directory, used with 'x-accel-redirect'
+SUMMARY_IMAGE_ACCEL_PREFIX = os.environ.get('SUMMARY_IMAGE_ACCEL_PREFIX', '/protected/cache/')
 
 
 # Password validation
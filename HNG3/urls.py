@@ -1,15 +1,22 @@
 """
 URL configuration for HNG3 project.
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from countries.views import status_view
+from countries.async_views import use_async_views
+from countries.views import metrics_view, status_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Include both trailing and non-trailing slash versions of the status endpoint
     path('status/', status_view, name='status-with-slash'),
     path('status', status_view, name='status-no-slash'),
+    path('metrics', metrics_view, name='metrics'),
     # Include all countries app URLs (both with and without trailing slashes)
     path('', include('countries.urls')),
 ]
+
+if settings.ASYNC_VIEWS:
+    # Under ASGI, answer the read endpoints with native async views (countries/async_views.py)
+    use_async_views(urlpatterns)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class CountriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'countries'
+
+    def ready(self):
+        if settings.METRICS_ENABLED:
+            from .metrics import install_query_hook
+            connection_created.connect(install_query_hook)
@@ -0,0 +1,194 @@
+"""
+Native async versions of the read endpoints, used when ASYNC_VIEWS is on (the default under
+HNG3/asgi.py).
+
+DRF views are synchronous, so under an ASGI server each call is pushed through a thread
+hop. GET requests for the list, a country, search, /status and the summary image are answered here
+instead, with Django's async ORM; responses are byte-identical to the DRF ones. Writes,
+the browsable API (non-JSON formats) and keyset pages still go to the DRF views.
+"""
+import functools
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .cache import aconditional, aget_data_version, list_cache, list_cache_key, make_etag, ranged_response
+from .encoders import FIELDS, astream_countries, encode_countries, encode_country, encode_data
+from .metrics import note_cache
+from .models import Country
+from .search import normalize, parse_limit, search_index
+from .stats import aget_stats
+from .summary import aread_summary, summary_path
+from .views import filter_countries
+
+# Route names (from countries/urls.py and HNG3/urls.py) -> async GET handler
+ASYNC_ROUTES = {}
+
+
+def _route(*names):
+    def register(view):
+        for name in names:
+            ASYNC_ROUTES[name] = view
+        return view
+    return register
+
+
+def _json(data, status=200):
+    response = HttpResponse(encode_data(data), content_type='application/json', status=status)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _wants_json(request, fmt):
+    # What DRF's content negotiation would pick between JSONRenderer and the browsable API
+    fmt = fmt or request.GET.get('format')
+    if fmt:
+        return fmt == 'json'
+    return 'text/html' not in request.headers.get('Accept', '')
+
+
+@_route('country-list', 'country-list-no-slash')
+async def country_list(request):
+    params = request.GET
+    if 'cursor' in params or 'limit' in params:
+        return None
+    key = list_cache_key(params)
+    generation, modified_at = await aget_data_version()
+    etag = make_etag('countries', generation, key)
+
+    async def render():
+        if params.get('stream', '').lower() in ('1', 'true', 'yes'):
+            return StreamingHttpResponse(
+                astream_countries(filter_countries(params), settings.LIST_STREAM_CHUNK_SIZE),
+                content_type='application/json',
+            )
+        body = list_cache.get(key, generation)
+        if body is None:
+            rows = [row async for row in filter_countries(params).values_list(*FIELDS)]
+            body = encode_countries(rows)
+            list_cache.set(key, generation, body)
+        return HttpResponse(body, content_type='application/json')
+
+    response = await aconditional(request, etag, modified_at, render)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@_route('country-detail', 'country-detail-no-slash')
+async def country_detail(request, name):
+    row = await Country.objects.by_name(name).values_list(*FIELDS).afirst()
+    if not row:
+        return _json({"error": "Country not found"}, status=404)
+    data = dict(zip(FIELDS, row))
+    etag = make_etag('country', data['id'], data['last_refreshed_at'])
+
+    async def render():
+        return HttpResponse(encode_country(row), content_type='application/json')
+
+    response = await aconditional(request, etag, data['last_refreshed_at'], render)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@_route('country-search', 'country-search-no-slash')
+async def country_search(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError as e:
+        return _json({"error": "Validation failed", "details": {"limit": str(e)}}, status=400)
+    if not normalize(query):
+        return _json({"error": "Validation failed", "details": {"q": "is required"}}, status=400)
+    generation, modified_at = await aget_data_version()
+    etag = make_etag('search', generation, normalize(query), limit)
+
+    async def render():
+        index = search_index.current(generation)
+        if index is None:
+            # Building reads the whole table; do it in the ORM's thread
+            index = await sync_to_async(search_index.get)(generation)
+        else:
+            note_cache('search', True)
+        return HttpResponse(encode_countries(index.search(query, limit)), content_type='application/json')
+
+    response = await aconditional(request, etag, modified_at, render)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@_route('status-with-slash', 'status-no-slash', 'country-status', 'country-status-no-slash')
+async def status(request):
+    stats = await aget_stats()
+    return _json({
+        'total_countries': stats.total_countries,
+        'last_refreshed_at': stats.last_refreshed_at,
+        'list_cache': list_cache.stats(),
+    })
+
+
+@_route('country-image', 'country-image-no-slash')
+async def image(request):
+    ext = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'png'
+    content_type = f'image/{ext}'
+    image_path = summary_path(ext)
+    mode = settings.SUMMARY_IMAGE_SERVE
+    try:
+        if mode == 'memory':
+            version, data = await aread_summary(ext)
+        else:
+            stat = os.stat(image_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return _json({'error': 'Summary image not found'}, status=404)
+
+    etag = make_etag('summary', ext, *version)
+    modified_at = datetime.fromtimestamp(version[0] / 1e9, tz=dt_timezone.utc)
+
+    async def render():
+        if mode == 'memory':
+            return ranged_response(request, data, content_type, etag)
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = settings.SUMMARY_IMAGE_ACCEL_PREFIX + os.path.basename(image_path)
+        else:
+            response.headers['X-Sendfile'] = image_path
+        return response
+
+    response = await aconditional(request, etag, modified_at, render)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def read_path(async_view, sync_view):
+    """
+    A view that answers JSON GET/HEAD requests with `async_view` and hands everything else
+    (and whatever `async_view` declines by returning None) to the synchronous DRF view.
+    """
+    sync_call = sync_to_async(sync_view)
+
+    @functools.wraps(sync_view)
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD') and _wants_json(request, kwargs.get('format')):
+            view_kwargs = {key: value for key, value in kwargs.items() if key != 'format'}
+            response = await async_view(request, *args, **view_kwargs)
+            if response is not None:
+                return response
+        return await sync_call(request, *args, **kwargs)
+
+    return view
+
+
+def use_async_views(urlpatterns):
+    """Swap in the async handlers for the routes in ASYNC_ROUTES; returns `urlpatterns`."""
+    for pattern in urlpatterns:
+        if hasattr(pattern, 'url_patterns'):
+            use_async_views(pattern.url_patterns)
+            continue
+        async_view = ASYNC_ROUTES.get(pattern.name)
+        if async_view is not None:
+            pattern.callback = read_path(async_view, pattern.callback)
+    return urlpatterns
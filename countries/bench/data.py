@@ -0,0 +1,123 @@
+"""
+Synthetic upstream data for the benchmarks, and the original implementations they compare against.
+"""
+import json
+import os
+import random
+from decimal import Context, Decimal
+
+from rest_framework.renderers import JSONRenderer
+
+from countries.encoders import FIELDS, encode_countries
+from countries.models import Country
+from countries.serializers import CountrySerializer
+
+CURRENCIES = ['NGN', 'USD', 'EUR', 'GBP', 'GHS', 'KES', 'JPY', 'INR', 'BRL', 'ZAR']
+REGIONS = ['Africa', 'Americas', 'Asia', 'Europe', 'Oceania']
+
+
+def synthetic_payload(rows, seed=0):
+    """Fake restcountries/er-api responses with `rows` countries."""
+    rng = random.Random(seed)
+    countries_data = [
+        {
+            'name': f'Country {i:06d}',
+            'capital': f'Capital {i}',
+            'region': rng.choice(REGIONS),
+            'population': rng.randint(10_000, 200_000_000),
+            'flag': f'https://flagcdn.com/{i}.svg',
+            'currencies': [{'code': rng.choice(CURRENCIES)}],
+        }
+        for i in range(rows)
+    ]
+    rates = {code: round(rng.uniform(0.5, 1500), 4) for code in CURRENCIES}
+    return countries_data, rates
+
+
+def write_snapshot(directory, countries_data, rates):
+    """Stand-ins for both upstream APIs: the countries.json/rates.json that run_refresh(snapshot_dir=) replays."""
+    os.makedirs(directory, exist_ok=True)
+    for source, body in (('countries', countries_data), ('rates', {'result': 'success', 'rates': rates})):
+        with open(os.path.join(directory, f'{source}.json'), 'w', encoding='utf-8') as f:
+            json.dump(body, f)
+
+
+def legacy_build_records(countries_data, rates):
+    """The original transform: one Python object at a time, random.uniform per row."""
+    records = []
+    for country_data in countries_data:
+        name = country_data.get('name')
+        if not name:
+            continue
+        currencies = country_data.get('currencies') or []
+        currency_code = None
+        if len(currencies) > 0 and currencies[0]:
+            currency_code = currencies[0].get('code') if isinstance(currencies[0], dict) else None
+        exchange_rate = None
+        estimated_gdp = None
+        population = country_data.get('population') or 0
+        if not currencies:
+            currency_code = None
+            estimated_gdp = 0
+        elif currency_code and currency_code in rates:
+            try:
+                exchange_rate = float(rates[currency_code])
+            except Exception:
+                exchange_rate = None
+            if population and exchange_rate:
+                estimated_gdp = (population * random.uniform(1000, 2000)) / exchange_rate
+        records.append({
+            'name': name,
+            'capital': country_data.get('capital'),
+            'region': country_data.get('region'),
+            'population': population,
+            'currency_code': currency_code,
+            'exchange_rate': exchange_rate,
+            'estimated_gdp': estimated_gdp,
+            'flag_url': country_data.get('flag'),
+        })
+    return records
+
+
+def legacy_upsert(records):
+    """The original refresh loop: one case-insensitive SELECT plus one write per row."""
+    for record in records:
+        existing = Country.objects.filter(name__iexact=record['name']).first()
+        if existing:
+            for field, value in record.items():
+                if field != 'name':
+                    setattr(existing, field, value)
+            existing.save()
+        else:
+            Country.objects.create(**record)
+
+
+class LegacyCountrySerializer(CountrySerializer):
+    """CountrySerializer as it was with DecimalField columns: DRF's per-field dispatch."""
+
+    def to_representation(self, instance):
+        return super(CountrySerializer, self).to_representation(instance)
+
+
+_decimal_context = Context(prec=20)
+_cents = Decimal('0.01')
+
+
+def legacy_list(queryset):
+    """Serialize the way the list view did when exchange_rate/estimated_gdp were DECIMAL(20,2)."""
+    countries = list(queryset)
+    for country in countries:
+        # What DecimalField.from_db_value allocated for every row
+        for name in ('exchange_rate', 'estimated_gdp'):
+            value = getattr(country, name)
+            if value is not None:
+                setattr(country, name, _decimal_context.create_decimal_from_float(value).quantize(_cents))
+    return JSONRenderer().render(LegacyCountrySerializer(countries, many=True).data)
+
+
+def serializer_list(queryset):
+    return JSONRenderer().render(CountrySerializer(queryset, many=True).data)
+
+
+def encoder_list(queryset):
+    return encode_countries(queryset.values_list(*FIELDS))
@@ -0,0 +1,235 @@
+"""
+Measuring helpers for bench_countries: timers, query counts, the WSGI request driver and
+JSON reports that can be compared between commits.
+"""
+import copy
+import gc
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import quote, urlencode
+
+import django
+from django.conf import settings
+from django.db import connection, connections, reset_queries, transaction
+from django.db.utils import load_backend
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, setup_databases
+
+from countries.cache import list_cache
+from countries.db.pool import PooledDatabaseWrapperMixin
+from countries.encoders import orjson
+from countries.metrics import RequestStats
+from countries.refresh import run_refresh
+from countries.search import search_index
+from countries.transform import np
+
+
+def measure(func, *args):
+    # The query log is a bounded deque; start empty so the capture slice stays accurate
+    reset_queries()
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        with transaction.atomic():
+            result = func(*args)
+        elapsed = time.perf_counter() - start
+    return {'queries': len(ctx.captured_queries), 'seconds': round(elapsed, 4), 'result': result}
+
+
+def timed(func, *args, **kwargs):
+    gc.collect()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def connection_modes(settings_dict, delay):
+    """
+    (label, DatabaseWrapper) for reconnecting per request, a persistent connection and the
+    pool. `delay` seconds are added to every new connection to stand in for the handshake
+    with a remote server, which a local database doesn't have.
+    """
+    engines = {pooled: plain for plain, pooled in settings.POOLED_ENGINES.items()}
+    engine = engines.get(settings_dict['ENGINE'], settings_dict['ENGINE'])
+    connects = []
+
+    class Remote(load_backend(engine).DatabaseWrapper):
+        def get_new_connection(self, conn_params):
+            connects.append(1)
+            time.sleep(delay)
+            return super().get_new_connection(conn_params)
+
+    class Pooled(PooledDatabaseWrapperMixin, Remote):
+        pass
+
+    base = {**settings_dict, 'ENGINE': engine, 'CONN_HEALTH_CHECKS': True}
+    modes = [
+        ('reconnect', Remote, {**base, 'CONN_MAX_AGE': 0}),
+        ('persistent', Remote, {**base, 'CONN_MAX_AGE': 60}),
+        ('pool', Pooled, {**base, 'CONN_MAX_AGE': 0, 'POOL': {'SIZE': 4, 'TIMEOUT': 10}}),
+    ]
+    for label, wrapper_class, mode_settings in modes:
+        yield label, wrapper_class(copy.deepcopy(mode_settings), 'default'), connects
+
+
+def setup_file_databases(tmp):
+    """
+    setup_databases(), with SQLite test databases in a file under `tmp` rather than in memory.
+
+    Django never really closes an in-memory test database, and other processes can't open
+    it, so connection reuse and server benchmarks need one on disk. Returns the config for
+    teardown_databases().
+    """
+    for alias in connections:
+        wrapper = connections[alias]
+        test_settings = wrapper.settings_dict.setdefault('TEST', {})
+        name = test_settings.get('NAME')
+        if wrapper.vendor == 'sqlite' and (not name or wrapper.creation.is_in_memory_db(name)):
+            test_settings['NAME'] = os.path.join(tmp, f'{alias}.sqlite3')
+    return setup_databases(verbosity=0, interactive=False)
+
+
+def wsgi_get(handler, path):
+    """A GET through the full WSGI stack, so request_started/finished manage connections as in production."""
+    response = handler(RequestFactory().get(path).environ, lambda status, headers: None)
+    b''.join(response)
+    # Fires request_finished, which closes (or returns to the pool) per CONN_MAX_AGE
+    response.close()
+    return response.status_code
+
+
+def percentile(values, fraction):
+    """`fraction` percentile of the sorted list `values`."""
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+def profile_refresh(prepare, snapshot_dir, force=False):
+    """
+    Queries, database time and wall time of one run_refresh(), then the peak traced memory of
+    a second, identical run (tracemalloc slows allocation down, so it doesn't share the timed run).
+    `prepare` puts the table and the snapshot into the state the run should start from.
+    """
+    prepare()
+    stats = RequestStats()
+    gc.collect()
+    with connection.execute_wrapper(stats):
+        start = time.perf_counter()
+        status_code, body = run_refresh(force=force, snapshot_dir=snapshot_dir)
+        elapsed = time.perf_counter() - start
+    assert status_code == 200, body
+
+    prepare()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_refresh(force=force, snapshot_dir=snapshot_dir)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': stats.queries,
+        'db_ms': round(stats.db_seconds * 1000, 3),
+        'seconds': round(elapsed, 4),
+        'peak_kb': peak // 1024,
+        'inserted': body['inserted'],
+        'updated': body['updated'],
+        'unchanged': body['unchanged'],
+    }
+
+
+def profile_endpoint(handler, path, requests):
+    """
+    GET `path` through the WSGI stack: one cold request with the list and search caches
+    emptied, then `requests` warm ones. Queries are per request.
+    """
+    list_cache.clear()
+    search_index.clear()
+    cold = RequestStats()
+    with connection.execute_wrapper(cold):
+        start = time.perf_counter()
+        status_code = wsgi_get(handler, path)
+        cold_seconds = time.perf_counter() - start
+    assert status_code == 200, (path, status_code)
+
+    warm = RequestStats()
+    latencies = []
+    with connection.execute_wrapper(warm):
+        for _ in range(requests):
+            start = time.perf_counter()
+            wsgi_get(handler, path)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'cold_ms': round(cold_seconds * 1000, 3),
+        'cold_queries': cold.queries,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'queries': round(warm.queries / requests, 2),
+    }
+
+
+def suite_paths():
+    """(name, path) of every read endpoint the suite times; the list once per filter/sort combination."""
+    paths = []
+    for region in (None, 'Africa'):
+        for currency in (None, 'USD'):
+            for sort in (None, 'gdp_desc'):
+                params = {key: value for key, value in
+                          (('region', region), ('currency', currency), ('sort', sort)) if value}
+                name = 'list' + ''.join(f' {key}={value}' for key, value in params.items())
+                paths.append((name, '/countries' + (f'?{urlencode(params)}' if params else '')))
+    paths += [
+        ('retrieve', '/countries/' + quote('Country 000001')),
+        ('search', '/countries/search?q=country%200001'),
+        ('status', '/status'),
+        ('image', '/countries/image'),
+    ]
+    return paths
+
+
+def run_metadata():
+    """What a report was measured on, so results from different commits and machines can be told apart."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'numpy': np is not None,
+        'orjson': orjson is not None,
+        'cpus': os.cpu_count(),
+    }
+
+
+# Result fields compared against a baseline, and whether higher is better
+COMPARED = {'seconds': False, 'peak_kb': False, 'queries': False, 'mean_ms': False, 'p95_ms': False, 'rps': True}
+
+
+def compare_results(baseline, results):
+    """Lines describing how each result moved relative to the result with the same key in `baseline`."""
+    previous = {(result['rows'], result['group'], result['name']): result for result in baseline['results']}
+    lines = []
+    for result in results:
+        old = previous.get((result['rows'], result['group'], result['name']))
+        if old is None:
+            continue
+        changes = []
+        for field, higher_is_better in COMPARED.items():
+            if field not in result or not old.get(field):
+                continue
+            change = (result[field] - old[field]) / old[field] * 100
+            worse = change < 0 if higher_is_better else change > 0
+            changes.append(f'{field} {old[field]} -> {result[field]} ({change:+.0f}%{"!" if worse and abs(change) >= 10 else ""})')
+        if changes:
+            lines.append(f'rows={result["rows"]:<7} {result["group"]:<8} {result["name"]:<48} ' + '  '.join(changes))
+    return lines
@@ -0,0 +1,117 @@
+"""
+Load generation for bench_countries: in-process worker threads driving the WSGI handler
+(--load), and gunicorn/uvicorn servers hit by keep-alive asyncio clients (--concurrency).
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .harness import wsgi_get
+
+
+def load_worker(handler, paths, deadline, latencies, errors):
+    """One thread sending GETs for `paths` round-robin until `deadline`; latencies are keyed by path."""
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status_code = wsgi_get(handler, path)
+            except Exception as e:
+                errors.append((path, repr(e)))
+                continue
+            latencies[path].append(time.perf_counter() - start)
+            if status_code != 200:
+                errors.append((path, status_code))
+    finally:
+        connections.close_all()
+
+
+SERVERS = {
+    # Threaded WSGI workers, the existing deployment
+    'wsgi': (['-m', 'gunicorn', 'HNG3.wsgi:application', '-k', 'gthread'], {}),
+    # ASGI with the DRF views, each pushed through a thread hop
+    'asgi-sync': (['-m', 'uvicorn', 'HNG3.asgi:application'], {'ASYNC_VIEWS': '0'}),
+    # ASGI with the native async read views
+    'asgi': (['-m', 'uvicorn', 'HNG3.asgi:application'], {'ASYNC_VIEWS': '1'}),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers, threads, settings_dict):
+    args, env = SERVERS[mode]
+    args = [sys.executable, *args]
+    if mode == 'wsgi':
+        args += ['-b', f'127.0.0.1:{port}', '-w', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    else:
+        args += ['--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    # Point the server at the benchmark database through the DB_* settings
+    env = {
+        **os.environ, **env,
+        'DB_ENGINE': settings_dict['ENGINE'], 'DB_NAME': str(settings_dict['NAME']),
+        'DB_USER': settings_dict['USER'], 'DB_PASSWORD': settings_dict['PASSWORD'],
+        'DB_HOST': settings_dict['HOST'], 'DB_PORT': str(settings_dict['PORT']),
+    }
+    process = subprocess.Popen(args, env=env, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f'{mode} server exited with {process.returncode}')
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def http_client(port, path, deadline, latencies, errors):
+    """One keep-alive connection sending GET `path` back to back until `deadline`."""
+    request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: application/json\r\n\r\n'.encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            start = time.perf_counter()
+            writer.write(request)
+            head = (await reader.readuntil(b'\r\n\r\n')).lower()
+            length = int(head.split(b'content-length:', 1)[1].split(b'\r\n', 1)[0])
+            await reader.readexactly(length)
+            # Only successful responses count towards throughput and latency
+            if head.startswith(b'http/1.1 2'):
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(head.split(b'\r\n', 1)[0].decode())
+            if b'connection: close' in head:
+                writer.close()
+                writer = None
+        except (OSError, IndexError, ValueError, asyncio.IncompleteReadError) as e:
+            errors.append(e)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def generate_load(port, path, clients, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(http_client(port, path, deadline, latencies, errors) for _ in range(clients)))
+    return time.perf_counter() - start, sorted(latencies), errors
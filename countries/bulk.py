@@ -0,0 +1,248 @@
+"""
+POST /countries/bulk: many upserts and deletes in one request.
+
+The body is a JSON array or NDJSON (one operation per line) and is parsed incrementally as
+it is read. Operations are validated and written in batches, all inside one transaction,
+so large payloads need neither the whole body nor every model instance in memory.
+"""
+import codecs
+import json
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Country, lookup_key
+from .serializers import CountryBulkSerializer
+
+BATCH_SIZE = 500
+READ_SIZE = 64 * 1024
+
+# Columns a bulk upsert writes; exchange_rate and estimated_gdp are read-only, as in PUT
+WRITE_FIELDS = ['name', 'capital', 'region', 'population', 'currency_code', 'flag_url']
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines', 'application/x-jsonlines')
+
+
+class BulkError(Exception):
+    """The payload as a whole is unusable; nothing is written."""
+
+    def __init__(self, status_code, message, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.details = details
+
+
+def _read_text(stream):
+    """Decoded text chunks from `stream`, enforcing BULK_MAX_BYTES as bytes arrive."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    total = 0
+    while True:
+        data = stream.read(READ_SIZE) if stream is not None else b''
+        total += len(data)
+        if total > settings.BULK_MAX_BYTES:
+            raise BulkError(413, 'Payload too large', f'limit is {settings.BULK_MAX_BYTES} bytes')
+        try:
+            text = decoder.decode(data, final=not data)
+        except UnicodeDecodeError as e:
+            raise BulkError(400, 'Invalid JSON', str(e))
+        if not data:
+            # An empty chunk marks the end of the body for the parsers
+            yield ''
+            return
+        if text:
+            yield text
+
+
+def iter_ndjson(stream):
+    """One decoded value per non-blank line."""
+    buffer = ''
+    line_number = 0
+    for text in _read_text(stream):
+        buffer += text
+        *lines, buffer = buffer.split('\n')
+        if not text:
+            lines.append(buffer)
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise BulkError(400, 'Invalid JSON', f'line {line_number}: {e}')
+
+
+def iter_json_array(stream):
+    """The elements of a top-level JSON array, decoded one at a time as the body is read."""
+    decoder = json.JSONDecoder()
+    chunks = _read_text(stream)
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+
+    def more():
+        nonlocal buffer, position, eof
+        text = next(chunks)
+        eof = not text
+        buffer = buffer[position:] + text
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            more()
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise BulkError(400, 'Invalid JSON', 'expected a JSON array or an NDJSON body')
+    position += 1
+    while True:
+        skip_whitespace()
+        if buffer[position:position + 1] == ']':
+            position += 1
+            break
+        if started:
+            if buffer[position:position + 1] != ',':
+                raise BulkError(400, 'Invalid JSON', "expected ',' or ']'")
+            position += 1
+            skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if eof:
+                    raise BulkError(400, 'Invalid JSON', str(e))
+                more()
+                continue
+            # A number or literal at the end of the buffer may continue in the next chunk
+            if end == len(buffer) and not eof and not isinstance(value, (dict, list, str)):
+                more()
+                continue
+            break
+        position = end
+        started = True
+        yield value
+    skip_whitespace()
+    if position < len(buffer):
+        raise BulkError(400, 'Invalid JSON', 'unexpected data after the array')
+
+
+def _error(index, name, details):
+    return {'index': index, 'name': name, 'status': 'error', 'details': details}
+
+
+class BulkWriter:
+    """Validates and writes operations a batch at a time; call inside a transaction."""
+
+    def __init__(self, validate_required):
+        self.validate_required = validate_required
+        self.serializer = CountryBulkSerializer()
+        self.results = []
+        self.batch = []
+        self.batch_keys = set()
+        self.changed = False
+
+    def add(self, index, item):
+        if len(self.results) + len(self.batch) >= settings.BULK_MAX_ITEMS:
+            raise BulkError(413, 'Payload too large', f'limit is {settings.BULK_MAX_ITEMS} operations')
+        if not isinstance(item, dict):
+            self.results.append(_error(index, None, 'each operation must be a JSON object'))
+            return
+        data = dict(item)
+        op = data.pop('op', 'upsert')
+        name = data.get('name')
+        if op not in ('upsert', 'delete'):
+            self.results.append(_error(index, name, {'op': "must be 'upsert' or 'delete'"}))
+            return
+        if op == 'delete' and not name:
+            self.results.append(_error(index, name, {'name': 'is required'}))
+            return
+        if op == 'upsert':
+            errors = self.validate_required(data)
+            if not errors:
+                try:
+                    data = self.serializer.run_validation(data)
+                except ValidationError as e:
+                    errors = e.detail
+            if errors:
+                self.results.append(_error(index, name, errors))
+                return
+            name = data['name']
+
+        key = lookup_key(str(name))
+        # Operations on the same country are applied in payload order
+        if key in self.batch_keys or len(self.batch) >= BATCH_SIZE:
+            self.flush()
+        self.batch.append((index, op, key, data))
+        self.batch_keys.add(key)
+
+    def flush(self):
+        if not self.batch:
+            return
+        existing = {
+            country.name_key: country
+            for country in Country.objects.filter(name_key__in=self.batch_keys)
+        }
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        for index, op, key, data in self.batch:
+            country = existing.get(key)
+            if op == 'delete':
+                if country is None:
+                    self.results.append({'index': index, 'name': data['name'], 'status': 'not_found'})
+                    continue
+                to_delete.append(country.pk)
+                self.results.append({'index': index, 'name': country.name, 'status': 'deleted'})
+                continue
+
+            if country is None:
+                country = Country(**{field: data.get(field) for field in WRITE_FIELDS})
+                to_create.append(country)
+                status = 'created'
+            else:
+                # Like serializer.save(), a field left out of the payload keeps its current value
+                for field in WRITE_FIELDS:
+                    if field in data:
+                        setattr(country, field, data[field])
+                # Manual edits diverge from upstream; with no fingerprint the next refresh rewrites this
+                # row (the write bumps the generation, so that refresh runs its diff)
+                country.fingerprint = None
+                # bulk_update bypasses auto_now
+                country.last_refreshed_at = now
+                to_update.append(country)
+                status = 'updated'
+            country.set_lookup_keys()
+            self.results.append({'index': index, 'name': country.name, 'status': status})
+
+        if to_delete:
+            Country.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            Country.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            Country.objects.bulk_update(
+                to_update, WRITE_FIELDS + ['fingerprint', 'last_refreshed_at'] + Country.LOOKUP_KEY_FIELDS,
+                batch_size=BATCH_SIZE,
+            )
+        self.changed = self.changed or bool(to_delete or to_create or to_update)
+        self.batch = []
+        self.batch_keys = set()
+
+    def summary(self):
+        counts = {status: 0 for status in ('created', 'updated', 'deleted', 'not_found', 'error')}
+        for result in self.results:
+            counts[result['status']] += 1
+        return {**counts, 'results': sorted(self.results, key=lambda result: result['index'])}
+
+
+def parse_body(request):
+    """Iterator over the operations in a bulk request body."""
+    content_type = request.content_type.split(';')[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        return iter_ndjson(request.stream)
+    return iter_json_array(request.stream)
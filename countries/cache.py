@@ -0,0 +1,193 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .metrics import note_cache
+from .models import RefreshState, lookup_key
+
+
+def get_data_version():
+    """(generation, modified_at) of the Country data; the generation changes on every write."""
+    return RefreshState.objects.filter(pk=1).values_list('generation', 'modified_at').first() or (0, None)
+
+
+async def aget_data_version():
+    return await RefreshState.objects.filter(pk=1).values_list('generation', 'modified_at').afirst() or (0, None)
+
+
+def get_generation():
+    return get_data_version()[0]
+
+
+def bump_generation():
+    """Invalidate cached responses in every worker process after a write to Country."""
+    now = timezone.now()
+    if not RefreshState.objects.filter(pk=1).update(generation=F('generation') + 1, modified_at=now):
+        RefreshState.objects.get_or_create(pk=1, defaults={'generation': 1, 'modified_at': now})
+
+
+def make_etag(*parts):
+    """Strong ETag from the values that fully determine a response body."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional(request, etag, last_modified, render):
+    """
+    Answer If-None-Match/If-Modified-Since with 304 (or 412) without calling `render`;
+    otherwise render the response. Either way attach ETag, Last-Modified and Cache-Control.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+    return _add_validators(response, etag, timestamp)
+
+
+async def aconditional(request, etag, last_modified, render):
+    """conditional() for async views; `render` is a coroutine function."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await render()
+    return _add_validators(response, etag, timestamp)
+
+
+def _add_validators(response, etag, timestamp):
+    if response.status_code in (200, 206, 304):
+        response.headers['ETag'] = etag
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE)
+    return response
+
+
+def _parse_range(header, length):
+    """(start, end) for a single `bytes=` range, 'unsatisfiable', or None to send everything."""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        # Multipart ranges aren't worth it for a small image; a full 200 is always allowed
+        return None
+    start, _, end = spec.strip().partition('-')
+    try:
+        if not start:
+            suffix = int(end)
+            if suffix <= 0:
+                return 'unsatisfiable'
+            return max(length - suffix, 0), length - 1
+        start = int(start)
+        end = min(int(end), length - 1) if end else length - 1
+    except ValueError:
+        return None
+    if start >= length or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def ranged_response(request, data, content_type, etag):
+    """Serve `data`, honouring a single-part Range header (and If-Range) with 206/416."""
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    byte_range = _parse_range(header, len(data)) if header and (not if_range or if_range == etag) else None
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{len(data)}'
+    elif byte_range is None:
+        response = HttpResponse(data, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = HttpResponse(data[start:end + 1], content_type=content_type, status=206)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+class ResponseCache:
+    """
+    Per-process LRU of pre-rendered response bodies, bounded by entry count and total bytes.
+
+    Entries belong to one data generation; the first lookup with a newer generation drops
+    everything, so a write anywhere invalidates all processes without any messaging.
+    """
+
+    def __init__(self, max_entries, max_bytes, name='list'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Label for per-request cache results in /metrics and Server-Timing
+        self.name = name
+
+    def _reset(self, generation):
+        self._entries.clear()
+        self._bytes = 0
+        self._generation = generation
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key, generation):
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        note_cache(self.name, body is not None)
+        return body
+
+    def set(self, key, generation, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                # A write happened while this body was being rendered; don't keep it
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+
+def list_cache_key(query_params):
+    """Normalize the filters CountryViewSet.get_queryset understands."""
+    sort = query_params.get('sort')
+    return (
+        lookup_key(query_params.get('region') or ''),
+        lookup_key(query_params.get('currency') or ''),
+        sort if sort == 'gdp_desc' else '',
+    )
+
+
+list_cache = ResponseCache(settings.LIST_CACHE_MAX_ENTRIES, settings.LIST_CACHE_MAX_BYTES)
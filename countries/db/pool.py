@@ -0,0 +1,139 @@
+"""
+A bounded per-process pool of database connections for backends Django can't pool itself.
+
+Django 5.1+ pools natively only on PostgreSQL (OPTIONS['pool']). For MySQL (and SQLite, as a
+local stand-in) the backends in countries/db/ mix in PooledDatabaseWrapperMixin: closing a
+connection hands it back to the pool and opening one takes an idle connection first, so a
+worker reuses a few connections across requests and threads instead of paying the TCP/TLS
+handshake and authentication to a remote server every time.
+
+Enabled with DB_POOL_SIZE (see HNG3/settings.py), which sets DATABASES[...]['POOL'].
+"""
+import threading
+
+from django.db import OperationalError
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """At most `size` open connections; callers wait up to `timeout` seconds for a free one."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        # Most recently returned first, so idle connections beyond the working set age out
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, connect, check=None):
+        """An idle connection that passes `check`, or a new one from `connect()`."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'No database connection free after {self.timeout}s (pool size {self.size})')
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    conn = connect()
+                    self.created += 1
+                    return conn
+                if check is None or check(conn):
+                    self.reused += 1
+                    return conn
+                _discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, reusable=True):
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            _discard(conn)
+        self._slots.release()
+
+    def close_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            _discard(conn)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+
+def _discard(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def get_pool(alias, settings_dict):
+    # Keyed by target too: the test runner points an alias at a different database
+    key = (alias, settings_dict['HOST'], settings_dict['PORT'], settings_dict['NAME'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = settings_dict.get('POOL') or {}
+            pool = _pools[key] = ConnectionPool(int(options.get('SIZE', 10)), float(options.get('TIMEOUT', 10)))
+        return pool
+
+
+def close_pools():
+    """Close every idle pooled connection, e.g. before forking or when tearing down a test database."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_idle()
+
+
+def _ping(conn):
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Put in front of a backend's DatabaseWrapper. Django still decides when to open and close
+    (CONN_MAX_AGE, request_finished); those just become pool checkouts and returns.
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        # Idle connections may have been dropped by the server (wait_timeout) meanwhile
+        check = _ping if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+        return self.pool.acquire(lambda: connect(conn_params), check)
+
+    def _close(self):
+        conn = self.connection
+        if conn is None:
+            return
+        # connect() resets autocommit and session state, but an open transaction must not leak
+        # into the next checkout; a connection that can't roll back is thrown away
+        try:
+            conn.rollback()
+        except Exception:
+            reusable = False
+        else:
+            reusable = not self.errors_occurred or _ping(conn)
+        self.pool.release(conn, reusable)
@@ -0,0 +1,130 @@
+"""
+Read-only JSON encoding for Country rows, bypassing DRF's serializer machinery.
+
+Rows come from `.values_list(*FIELDS)` and the output is byte-identical to what
+JSONRenderer makes of CountrySerializer data. CountrySerializer is still used for writes
+and validation.
+"""
+from asgiref.sync import sync_to_async
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from .serializers import CountrySerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = CountrySerializer.Meta.fields
+_DATETIME_INDEX = FIELDS.index('last_refreshed_at')
+_FLOAT_INDEXES = [FIELDS.index('exchange_rate'), FIELDS.index('estimated_gdp')]
+
+# Same options JSONRenderer uses, so the output is byte-identical to Response(serializer.data)
+_encoder = encoders.JSONEncoder(
+    ensure_ascii=not api_settings.UNICODE_JSON,
+    allow_nan=not api_settings.STRICT_JSON,
+    separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': '),
+)
+_datetime_field = serializers.DateTimeField()
+
+# orjson only writes compact UTF-8, so it can only stand in for that JSONRenderer configuration
+_use_orjson = orjson is not None and api_settings.UNICODE_JSON and api_settings.COMPACT_JSON
+
+
+def to_dicts(rows):
+    """What CountrySerializer would emit for each `.values_list(*FIELDS)` tuple."""
+    formatted = {}
+    result = []
+    for row in rows:
+        data = dict(zip(FIELDS, row))
+        refreshed = row[_DATETIME_INDEX]
+        if refreshed is not None:
+            # A refresh stamps every row it writes with the same time; format each value once
+            text = formatted.get(refreshed)
+            if text is None:
+                text = formatted[refreshed] = _datetime_field.to_representation(refreshed)
+            data['last_refreshed_at'] = text
+        result.append(data)
+    return result
+
+
+def _orjson_float(value):
+    # Outside this range orjson writes exponents as 1e16 where json writes 1e+16; NaN and
+    # infinity are left to json, which rejects them like JSONRenderer does
+    return value is None or value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def _encode(value):
+    # JSONRenderer escapes these so the output is also valid JavaScript
+    return _encoder.encode(value).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _dumps(value, rows):
+    if _use_orjson and all(_orjson_float(row[i]) for row in rows for i in _FLOAT_INDEXES):
+        try:
+            body = orjson.dumps(value)
+        except TypeError:
+            # e.g. an integer wider than 64 bits; json copes with those
+            pass
+        else:
+            return body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return _encode(value)
+
+
+def encode_data(value):
+    """JSON for any other response data (dates, dicts), as JSONRenderer renders it."""
+    return _encode(value)
+
+
+def encode_countries(rows):
+    """JSON array for an iterable of `.values_list(*FIELDS)` tuples."""
+    rows = list(rows)
+    return _dumps(to_dicts(rows), rows)
+
+
+def encode_country(row):
+    """JSON object for one `.values_list(*FIELDS)` tuple."""
+    return _dumps(to_dicts([row])[0], [row])
+
+
+def encode_lines(rows):
+    """NDJSON: one JSON object per `.values_list(*FIELDS)` tuple, each followed by a newline."""
+    return b''.join(_dumps(data, [row]) + b'\n' for data, row in zip(to_dicts(rows), rows))
+
+
+def stream_countries(queryset, chunk_size=500):
+    """
+    Yield the JSON array for `queryset` piece by piece.
+
+    Rows come from `.values_list().iterator()`, so no model instances are built and at most
+    one chunk of rows is held in memory at a time.
+    """
+    yield b'['
+    separator = b''
+    chunk = []
+    for row in queryset.values_list(*FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield separator + encode_countries(chunk)[1:-1]
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + encode_countries(chunk)[1:-1]
+    yield b']'
+
+
+async def astream_countries(queryset, chunk_size=500):
+    """
+    stream_countries() for async views: each piece is fetched and encoded in the ORM's worker
+    thread, one hop per chunk.
+
+    QuerySet.aiterator() would do the same, but on Django 5.2 it runs a values_list() query
+    in the event loop (ValuesListIterable.__iter__ isn't a generator) and raises
+    SynchronousOnlyOperation.
+    """
+    pieces = stream_countries(queryset, chunk_size)
+    next_piece = sync_to_async(next)
+    while (piece := await next_piece(pieces, None)) is not None:
+        yield piece
@@ -0,0 +1,107 @@
+"""
+NDJSON/CSV dumps of the Country table: GET /countries/export and manage.py import_countries.
+
+Both formats carry the same fields as the API, so an export can be loaded into another
+environment without contacting the upstream APIs.
+"""
+import csv
+import io
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+from .encoders import FIELDS, encode_lines, to_dicts
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# Only used for content negotiation (?format=csv, Accept: text/csv); the rows themselves are
+# streamed, and error bodies are still JSON
+class NDJSONRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(JSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+INT_FIELDS = ['population']
+FLOAT_FIELDS = ['exchange_rate', 'estimated_gdp']
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    `.values_list(*FIELDS)` rows in primary key order, one chunk at a time.
+
+    Each chunk is its own indexed `pk > last` query, so memory stays flat on every backend
+    (MySQLdb buffers a whole result set even for .iterator()) and no transaction or cursor
+    is held open while the client reads.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(*FIELDS)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def export_ndjson(queryset, chunk_size):
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield encode_lines(chunk)
+
+
+def export_csv(queryset, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in iter_chunks(queryset, chunk_size):
+        writer.writerows([data[name] for name in FIELDS] for data in to_dicts(chunk))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export
+        yield buffer.getvalue().encode()
+
+
+def export(fmt, queryset, chunk_size):
+    """Byte chunks of `queryset` in `fmt` ('ndjson' or 'csv')."""
+    return (export_csv if fmt == 'csv' else export_ndjson)(queryset, chunk_size)
+
+
+def _csv_value(name, value):
+    # CSV has no null; empty cells are read back as null (or 0 for population)
+    if value == '':
+        return 0 if name in INT_FIELDS else None
+    if name in INT_FIELDS:
+        return int(value)
+    if name in FLOAT_FIELDS:
+        return float(value)
+    return value
+
+
+def read_rows(lines, fmt):
+    """
+    (line number, field dict) pairs from an export in `fmt`, one per country.
+    Raises ValueError with the line number.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            try:
+                yield reader.line_num, {name: _csv_value(name, value) for name, value in row.items() if name in FIELDS}
+            except ValueError as e:
+                raise ValueError(f'line {reader.line_num}: {e}')
+        return
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'line {line_number}: {e}')
@@ -0,0 +1,106 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import RefreshJob, RefreshState
+from .refresh import run_refresh
+
+logger = logging.getLogger(__name__)
+
+# One worker thread per process: refreshes are serialized anyway by the single-flight check
+_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='refresh-job')
+
+# Seconds between status checks while a synchronous refresh waits for the one in flight
+JOB_POLL_INTERVAL = 0.2
+
+TIMED_OUT = {'error': 'Internal server error', 'details': 'Refresh job timed out'}
+
+
+def _claim(force):
+    """
+    The refresh in flight, or a new one; returns (job, created).
+
+    The check-and-create runs under a row lock on RefreshState, so concurrent requests (even
+    from other gunicorn workers) coalesce onto a single job. Jobs older than
+    REFRESH_JOB_TIMEOUT are assumed to belong to a dead worker and are failed instead.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.REFRESH_JOB_TIMEOUT)
+    with transaction.atomic():
+        RefreshState.objects.select_for_update().get_or_create(pk=1)
+        RefreshJob.objects.filter(status__in=RefreshJob.ACTIVE, created_at__lt=cutoff).update(
+            status=RefreshJob.FAILED,
+            status_code=500,
+            result=TIMED_OUT,
+            finished_at=timezone.now(),
+        )
+        active = RefreshJob.objects.filter(status__in=RefreshJob.ACTIVE).first()
+        if active:
+            return active, False
+        return RefreshJob.objects.create(force=force), True
+
+
+def submit_refresh(force=False):
+    """Queue a background refresh, or join the one already in flight. Returns (job, created)."""
+    job, created = _claim(force)
+    if created:
+        _worker.submit(_run_job, job.pk)
+    return job, created
+
+
+def refresh_now(force=False, snapshot_dir=None):
+    """
+    Run a refresh in this thread, or wait for the one already in flight and return its outcome.
+
+    Goes through the same single-flight check as submit_refresh(), so synchronous and
+    background refreshes never overlap. `snapshot_dir` replays saved upstream responses
+    (see refresh_countries --from-snapshot); a refresh already in flight is joined as is.
+    Returns (status_code, body).
+    """
+    job, created = _claim(force)
+    if created:
+        return _execute(job.pk, snapshot_dir=snapshot_dir)
+    deadline = job.created_at + timedelta(seconds=settings.REFRESH_JOB_TIMEOUT)
+    while job.status in RefreshJob.ACTIVE:
+        if timezone.now() >= deadline:
+            return 500, TIMED_OUT
+        time.sleep(JOB_POLL_INTERVAL)
+        job.refresh_from_db(fields=['status', 'status_code', 'result'])
+    return job.status_code, job.result
+
+
+def _execute(job_id, snapshot_dir=None):
+    """Run the refresh for job `job_id` and record its outcome; returns (status_code, body)."""
+    jobs = RefreshJob.objects.filter(pk=job_id)
+    try:
+        jobs.update(status=RefreshJob.RUNNING, started_at=timezone.now())
+        force = jobs.values_list('force', flat=True).get()
+        status_code, body = run_refresh(
+            force=force, snapshot_dir=snapshot_dir, progress=lambda stage: jobs.update(stage=stage),
+        )
+        job = jobs.get()
+        job.status = RefreshJob.SUCCEEDED if status_code < 400 else RefreshJob.FAILED
+    except Exception as e:
+        logger.exception('Refresh job %s crashed', job_id)
+        job = jobs.get()
+        job.status = RefreshJob.FAILED
+        status_code, body = 500, {'error': 'Internal server error', 'details': str(e)}
+    job.status_code = status_code
+    job.result = body
+    job.stage = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'status_code', 'result', 'stage', 'finished_at'])
+    return status_code, body
+
+
+def _run_job(job_id):
+    close_old_connections()
+    try:
+        _execute(job_id)
+    finally:
+        # Worker threads own their connection; don't leave it open between jobs
+        connection.close()
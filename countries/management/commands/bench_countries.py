@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import quote
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from countries.bench.data import (
+    encoder_list, legacy_build_records, legacy_list, legacy_upsert, serializer_list, synthetic_payload,
+    write_snapshot,
+)
+from countries.bench.harness import (
+    compare_results, connection_modes, measure, percentile, profile_endpoint, profile_refresh, run_metadata,
+    setup_file_databases, suite_paths, timed, wsgi_get,
+)
+from countries.bench.load import SERVERS, free_port, generate_load, load_worker, start_server
+from countries.db.pool import close_pools
+from countries.encoders import FIELDS
+from countries.models import Country
+from countries.refresh import upsert_countries
+from countries.search import SearchIndex
+from countries.summary import generate_summary_image
+from countries.transform import build_records, np
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks against a throwaway test database. By default, the refresh write path '
+        '(old per-row loop vs bulk upsert); other modes: --transform, --serialize, --search, '
+        '--connections, --concurrency, --suite (offline refresh and endpoint suite with JSON '
+        'reports) and --load (in-process WSGI load generator).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=250, help='Number of synthetic countries.')
+        parser.add_argument('--transform', action='store_true',
+                            help='Benchmark only the (database-free) transform stage, at --sizes.')
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            help='Payload sizes for --transform and --search (default 10000 100000 1000000) '
+                                 'and table sizes for --suite (default 250 10000).')
+        parser.add_argument('--serialize', action='store_true',
+                            help='Benchmark rendering the list body (old Decimal path, serializer, read encoder) at --rows.')
+        parser.add_argument('--connections', action='store_true',
+                            help='Time GET /status and /countries/<name> reconnecting per request, with a '
+                                 'persistent connection and with the connection pool.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint for --connections and --suite.')
+        parser.add_argument('--search', action='store_true',
+                            help='Time building the search index and prefix, word and fuzzy lookups at --sizes.')
+        parser.add_argument('--concurrency', action='store_true',
+                            help='Requests per second from --clients keep-alive connections against gunicorn '
+                                 '(WSGI), uvicorn with the DRF views and uvicorn with the async views.')
+        parser.add_argument('--clients', type=int, default=100, help='Concurrent connections for --concurrency.')
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Seconds per server and endpoint for --concurrency, and of the --load run.')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes for --concurrency.')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Threads per gunicorn worker for --concurrency; worker threads for --load.')
+        parser.add_argument('--connect-delay', type=float, default=0.0, metavar='MS',
+                            help='Simulated handshake per new connection for --connections (e.g. 20 for a remote MySQL).')
+        parser.add_argument('--suite', action='store_true',
+                            help='Offline benchmark suite at each of --sizes: refresh from stubbed upstream '
+                                 'APIs (queries, time, peak memory), then every list filter/sort, retrieve, '
+                                 'search, /status and the summary image through the WSGI handler.')
+        parser.add_argument('--load', action='store_true',
+                            help='Drive the WSGI app in-process with --threads worker threads for --duration '
+                                 'seconds over a mix of the read endpoints, at --rows.')
+        parser.add_argument('--json', metavar='PATH',
+                            help='Also write the --suite/--load results as JSON to PATH ("-" for stdout).')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='A JSON report from an earlier --suite/--load run to compare against.')
+
+    def handle(self, *args, **options):
+        self.report_out = self.stdout
+        if options['json'] == '-':
+            # Keep stdout for the report itself
+            self.stdout = self.stderr
+        sizes = options['sizes']
+        if options['transform']:
+            return self.bench_transform(sizes or [10_000, 100_000, 1_000_000])
+        if options['search']:
+            return self.bench_search(sizes or [10_000, 100_000, 1_000_000])
+        if options['suite']:
+            return self.report(self.bench_suite(sizes or [250, 10_000], options['requests']), options)
+
+        rows = options['rows']
+        if options['load']:
+            return self.report(self.bench_load(rows, options['threads'], options['duration']), options)
+        if options['serialize']:
+            return self.bench_serialize(rows)
+        if options['connections']:
+            return self.bench_connections(rows, options['requests'], options['connect_delay'] / 1000)
+        if options['concurrency']:
+            return self.bench_concurrency(
+                rows, options['clients'], options['duration'], options['workers'], options['threads'])
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            countries_data, rates = synthetic_payload(rows)
+            for label, func in (('legacy', legacy_upsert), ('bulk', upsert_countries)):
+                Country.objects.all().delete()
+                passes = [
+                    ('insert', countries_data, rates),
+                    ('unchanged', countries_data, rates),
+                    # Every rate moves, so every row has to be rewritten
+                    ('rates moved', countries_data, {code: rate * 1.01 for code, rate in rates.items()}),
+                ]
+                for name, payload, payload_rates in passes:
+                    run = measure(func, build_records(payload, payload_rates))
+                    self.stdout.write(
+                        f'{label:>6}  rows={rows}  {name:<12} {run["queries"]:>5} queries  '
+                        f'{run["seconds"]:.4f}s  {run["result"] or ""}'
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def bench_transform(self, sizes):
+        self.stdout.write(f'GDP backend: {"numpy" if np is not None else "python"}')
+        for rows in sizes:
+            countries_data, rates = synthetic_payload(rows)
+            legacy = timed(legacy_build_records, countries_data, rates)
+            columnar = timed(build_records, countries_data, rates, seed=0)
+            self.stdout.write(
+                f'rows={rows:<8}  legacy {legacy:.4f}s  batch {columnar:.4f}s  '
+                f'({rows / columnar:,.0f} rows/s)'
+            )
+
+    def bench_search(self, sizes, repeat=200):
+        queries = [('prefix', 'country 0001'), ('word', '0001'), ('capital', 'capital 12'), ('fuzzy', 'contry 000123')]
+        for size in sizes:
+            records = build_records(*synthetic_payload(size), seed=0)
+            rows = [tuple({**record, 'id': i}.get(name) for name in FIELDS) for i, record in enumerate(records)]
+            build = timed(SearchIndex, rows)
+            index = SearchIndex(rows)
+            lookups = []
+            for label, query in queries:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    index.search(query, 10)
+                lookups.append(f'{label} {(time.perf_counter() - start) / repeat * 1e6:,.0f}us')
+            self.stdout.write(f'rows={size:<8}  build {build:.3f}s  ' + '  '.join(lookups))
+
+    def bench_serialize(self, rows, repeat=5):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with transaction.atomic():
+                upsert_countries(build_records(*synthetic_payload(rows), seed=0))
+            queryset = Country.objects.all()
+            for label, func in (('decimal', legacy_list), ('float', serializer_list), ('encoder', encoder_list)):
+                best = min(timed(func, queryset.all()) for _ in range(repeat))
+                self.stdout.write(f'{label:>7}  rows={rows}  {best:.4f}s  ({rows / best:,.0f} rows/s)')
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def bench_connections(self, rows, requests, delay):
+        tmp = tempfile.TemporaryDirectory()
+        old_config = setup_file_databases(tmp.name)
+        original = connections['default']
+        try:
+            with transaction.atomic():
+                upsert_countries(build_records(*synthetic_payload(rows), seed=0))
+            original.close()
+            handler = WSGIHandler()
+            paths = ['/status', '/countries/' + quote('Country 000001')]
+            for label, wrapper, connects in connection_modes(original.settings_dict, delay):
+                connections['default'] = wrapper
+                for path in paths:
+                    # Warm-up, so every mode starts with the list cache and code paths primed
+                    wsgi_get(handler, path)
+                    connects.clear()
+                    latencies = []
+                    for _ in range(requests):
+                        start = time.perf_counter()
+                        status = wsgi_get(handler, path)
+                        latencies.append(time.perf_counter() - start)
+                    assert status == 200, (path, status)
+                    latencies.sort()
+                    self.stdout.write(
+                        f'{label:>10}  {path:<28} mean {statistics.mean(latencies) * 1000:7.3f}ms  '
+                        f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.3f}ms  '
+                        f'{len(connects):>4} connects'
+                    )
+                wrapper.close()
+        finally:
+            connections['default'] = original
+            close_pools()
+            teardown_databases(old_config, verbosity=0)
+            tmp.cleanup()
+
+    def bench_concurrency(self, rows, clients, duration, workers, threads):
+        # The servers are separate processes; they need a database they can open
+        tmp = tempfile.TemporaryDirectory()
+        old_config = setup_file_databases(tmp.name)
+        try:
+            with transaction.atomic():
+                upsert_countries(build_records(*synthetic_payload(rows), seed=0))
+            connection.close()
+            paths = ['/status', '/countries/' + quote('Country 000001'), '/countries?region=Africa']
+            for mode in SERVERS:
+                port = free_port()
+                server = start_server(mode, port, workers, threads, connection.settings_dict)
+                try:
+                    for path in paths:
+                        # Warm-up: imports, connections and the list cache in every worker
+                        asyncio.run(generate_load(port, path, min(clients, 10), 0.5))
+                        elapsed, latencies, errors = asyncio.run(generate_load(port, path, clients, duration))
+                        count = len(latencies)
+                        if not count:
+                            raise CommandError(f'{mode}: every request to {path} failed, e.g. {errors[0]!r}')
+                        self.stdout.write(
+                            f'{mode:>9}  clients={clients}  {path:<28} {count / elapsed:8,.0f} req/s  '
+                            f'p50 {latencies[count // 2] * 1000:7.1f}ms  '
+                            f'p99 {latencies[int(count * 0.99) - 1] * 1000:7.1f}ms  {len(errors)} errors'
+                        )
+                        for error in sorted(set(map(str, errors)))[:3]:
+                            self.stderr.write(f'{mode}  {path}: {error}')
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            tmp.cleanup()
+
+    def bench_suite(self, sizes, requests):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        meta = run_metadata()
+        results = []
+        try:
+            # Upstream cache and summary image go to a scratch directory, not ./cache, and the
+            # image is rendered inline so refresh timings include it
+            with tempfile.TemporaryDirectory() as tmp, override_settings(
+                BASE_DIR=tmp, UPSTREAM_CACHE_DIR=os.path.join(tmp, 'upstream'),
+            ), mock.patch('countries.refresh.schedule_summary_image', generate_summary_image):
+                snapshot_dir = os.path.join(tmp, 'snapshot')
+                handler = WSGIHandler()
+                for rows in sizes:
+                    countries_data, rates = synthetic_payload(rows)
+                    moved_rates = {code: rate * 1.01 for code, rate in rates.items()}
+                    moved = []
+
+                    def empty():
+                        Country.objects.all().delete()
+                        write_snapshot(snapshot_dir, countries_data, rates)
+
+                    def move_rates():
+                        # Alternate between two rate tables so every run sees every row change
+                        moved.append(None)
+                        write_snapshot(snapshot_dir, countries_data, moved_rates if len(moved) % 2 else rates)
+
+                    passes = [
+                        ('insert', empty, True),
+                        # Same upstream bodies: answered from the response digests without a DB pass
+                        ('not modified', lambda: None, False),
+                        # Forced: every row is compared, none written
+                        ('unchanged', lambda: None, True),
+                        ('rates moved', move_rates, False),
+                    ]
+                    for name, prepare, force in passes:
+                        result = {'rows': rows, 'group': 'refresh', 'name': name,
+                                  **profile_refresh(prepare, snapshot_dir, force)}
+                        results.append(result)
+                        self.stdout.write(
+                            f'rows={rows:<7} refresh   {name:<48} {result["queries"]:>5} queries  '
+                            f'{result["seconds"]:.4f}s  peak {result["peak_kb"]:,} KiB'
+                        )
+
+                    connection.close()
+                    for name, path in suite_paths():
+                        result = {'rows': rows, 'group': 'endpoint', 'name': name, 'path': path,
+                                  **profile_endpoint(handler, path, requests)}
+                        results.append(result)
+                        self.stdout.write(
+                            f'rows={rows:<7} endpoint  {name:<48} cold {result["cold_ms"]:8.3f}ms  '
+                            f'mean {result["mean_ms"]:8.3f}ms  p95 {result["p95_ms"]:8.3f}ms  '
+                            f'{result["queries"]:g} queries'
+                        )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        return {'meta': meta, 'results': results}
+
+    def bench_load(self, rows, threads, duration):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        meta = run_metadata()
+        try:
+            with tempfile.TemporaryDirectory() as tmp, override_settings(BASE_DIR=tmp):
+                with transaction.atomic():
+                    upsert_countries(build_records(*synthetic_payload(rows), seed=0))
+                generate_summary_image(force=True)
+                connection.close()
+                handler = WSGIHandler()
+                names = {path: name for name, path in suite_paths()}
+                # Warm-up: imports and the list and search caches
+                for path in names:
+                    wsgi_get(handler, path)
+                connection.close()
+
+                latencies = {path: [] for path in names}
+                errors = []
+                deadline = time.perf_counter() + duration
+                workers = [threading.Thread(target=load_worker, args=(handler, list(names), deadline, latencies, errors))
+                           for _ in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        results = []
+        series = [('all', None, [value for values in latencies.values() for value in values])]
+        series += [(names[path], path, values) for path, values in latencies.items()]
+        for name, path, values in series:
+            values.sort()
+            result = {
+                'rows': rows, 'group': 'load', 'name': name, 'path': path, 'threads': threads,
+                'requests': len(values), 'rps': round(len(values) / elapsed, 1),
+                'p50_ms': round(percentile(values, 0.5) * 1000, 3) if values else None,
+                'p99_ms': round(percentile(values, 0.99) * 1000, 3) if values else None,
+                'errors': len(errors) if path is None else sum(1 for failed, _ in errors if failed == path),
+            }
+            results.append(result)
+            self.stdout.write(
+                f'threads={threads:<4} {name:<48} {result["rps"]:8,.0f} req/s  '
+                f'p50 {result["p50_ms"] or 0:7.2f}ms  p99 {result["p99_ms"] or 0:7.2f}ms  {result["errors"]} errors'
+            )
+        for path, error in errors[:5]:
+            self.stderr.write(f'{path}: {error}')
+        return {'meta': meta, 'results': results}
+
+    def report(self, report, options):
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            self.stdout.write(f'Compared with {options["baseline"]} (commit {baseline["meta"].get("commit")}):')
+            for line in compare_results(baseline, report['results']):
+                self.stdout.write(line)
+        if options['json'] == '-':
+            self.report_out.write(json.dumps(report, indent=2))
+        elif options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Wrote {options["json"]}')
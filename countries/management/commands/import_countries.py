@@ -0,0 +1,88 @@
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from countries.export import FLOAT_FIELDS, FORMATS, INT_FIELDS, read_rows
+from countries.models import Country
+from countries.refresh import BULK_BATCH_SIZE, UPSTREAM_FIELDS, write_records
+from countries.stats import countries_changed
+
+
+STRING_FIELDS = ['name', 'capital', 'region', 'currency_code', 'flag_url']
+
+
+def row_error(row):
+    """Why an exported row can't be written, or None. Checked up front so bad data fails with its line."""
+    for name in STRING_FIELDS:
+        value = row.get(name)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return f'{name} must be a string, got {value!r}'
+        max_length = Country._meta.get_field(name).max_length
+        if len(value) > max_length:
+            return f'{name} is longer than {max_length} characters'
+    for name in INT_FIELDS + FLOAT_FIELDS:
+        value = row.get(name)
+        numeric = (int,) if name in INT_FIELDS else (int, float)
+        # bool is an int subclass, but true/false isn't a population
+        if value is not None and (isinstance(value, bool) or not isinstance(value, numeric)):
+            return f'{name} must be a number, got {value!r}'
+    return None
+
+
+def to_record(row):
+    """An exported row as the field dict write_records expects."""
+    record = {name: row.get(name) for name in UPSTREAM_FIELDS}
+    record['name'] = row['name']
+    record['population'] = record['population'] or 0
+    return record
+
+
+class Command(BaseCommand):
+    help = 'Load countries from an NDJSON or CSV file made by GET /countries/export.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            help='Defaults to the file extension, or ndjson.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows read and upserted per step.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = read_rows(stream, fmt)
+            # All or nothing: a bad line halfway through leaves the table as it was
+            with transaction.atomic():
+                while True:
+                    try:
+                        chunk = list(islice(rows, options['batch_size']))
+                    except ValueError as e:
+                        raise CommandError(f'{path}: {e}')
+                    if not chunk:
+                        break
+                    records = []
+                    for line_number, row in chunk:
+                        if not isinstance(row, dict) or not row.get('name'):
+                            continue
+                        error = row_error(row)
+                        if error:
+                            raise CommandError(f'{path}: line {line_number}: {error}')
+                        records.append(to_record(row))
+                    totals['skipped'] += len(chunk) - len(records)
+                    for name, count in write_records(records, batch_size=BULK_BATCH_SIZE).items():
+                        totals[name] += count
+                if totals['inserted'] or totals['updated']:
+                    countries_changed()
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(', '.join(f'{name}={count}' for name, count in totals.items()))
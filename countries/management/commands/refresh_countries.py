@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from countries.jobs import refresh_now
+from countries.upstream import UpstreamError, fetch_upstream, save_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the refresh pipeline (same as POST /countries/refresh), optionally replaying saved '
+        'upstream responses so it works without network access.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-snapshot', metavar='DIR',
+                            help='Read countries.json and rates.json from DIR instead of the upstream APIs.')
+        parser.add_argument('--save-snapshot', metavar='DIR',
+                            help='Only fetch the configured sources and write them to DIR for later replay.')
+        parser.add_argument('--force', action='store_true', help='Bypass the upstream response cache.')
+        parser.add_argument('--repeat', type=int, default=1,
+                            help='Run the pipeline this many times (with --force) and report throughput.')
+
+    def handle(self, *args, **options):
+        if options['save_snapshot']:
+            try:
+                countries_resp, rates_resp = fetch_upstream(force=True, snapshot_dir=options['from_snapshot'])
+            except UpstreamError as e:
+                raise CommandError(e.details)
+            save_snapshot(options['save_snapshot'], countries_resp, rates_resp)
+            self.stdout.write(f'Saved {len(countries_resp.body)} countries to {options["save_snapshot"]}')
+            return
+
+        repeat = max(options['repeat'], 1)
+        force = options['force'] or repeat > 1
+        for run in range(1, repeat + 1):
+            start = time.perf_counter()
+            # Joins a refresh already running in the app instead of overlapping it
+            status_code, body = refresh_now(force=force, snapshot_dir=options['from_snapshot'])
+            elapsed = time.perf_counter() - start
+            if status_code != 200:
+                raise CommandError(json.dumps(body, cls=JSONEncoder))
+            rows = body['total_countries']
+            self.stdout.write(json.dumps(body, cls=JSONEncoder))
+            self.stdout.write(f'run {run}/{repeat}: {elapsed:.4f}s  ({rows / elapsed:,.0f} rows/s)')
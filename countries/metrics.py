@@ -0,0 +1,261 @@
+"""
+Per-process request metrics: latency histograms, SQL query counts and time, response sizes
+and cache results per view, exposed in the Prometheus text format at /metrics and summarised
+per response in a Server-Timing header.
+
+Recording a request costs a few perf_counter() calls and one short lock, so it stays on in
+production (METRICS_ENABLED=0 turns it off).
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Seconds; Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self):
+        # One slot per bucket plus +Inf; cumulated when rendered
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class RequestStats:
+    """What one request did; filled in by the DB wrapper and note_cache()."""
+
+    __slots__ = ('queries', 'db_seconds', 'cache')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection (see install_query_hook). The async ORM runs queries in a
+    # worker thread, but the request's context, and so its stats, goes with it.
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_hook(sender=None, connection=None, **kwargs):
+    """connection_created receiver, connected in CountriesConfig.ready()."""
+    # First, so connection.execute_wrapper() blocks around it still pop their own wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def note_cache(name, hit):
+    """Record a cache lookup made while serving the current request."""
+    stats = _current.get()
+    if stats is not None:
+        stats.cache.append(f'{name}-{"hit" if hit else "miss"}')
+
+
+# Anything else is counted as 'other', so arbitrary verbs can't create new series
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def _method(request):
+    return request.method if request.method in METHODS else 'other'
+
+
+def _escape(value):
+    # Label values in the text exposition format escape backslash, double quote and newline
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.latency = defaultdict(Histogram)
+            self.response_bytes = defaultdict(int)
+            self.queries = defaultdict(int)
+            self.db_seconds = defaultdict(float)
+            self.cache = defaultdict(int)
+
+    def observe(self, view, method, status, seconds, size, stats):
+        key = (view, method)
+        with self._lock:
+            self.requests[(view, method, status)] += 1
+            self.latency[key].observe(seconds)
+            self.response_bytes[key] += size
+            self.queries[key] += stats.queries
+            self.db_seconds[key] += stats.db_seconds
+            for result in stats.cache:
+                self.cache[(view, result)] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ['# HELP http_requests_total Requests served, by view, method and status.',
+                      '# TYPE http_requests_total counter']
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{{_labels(view=view, method=method, status=status)}}} {count}')
+
+            lines += ['# HELP http_request_duration_seconds Time spent in Django per request.',
+                      '# TYPE http_request_duration_seconds histogram']
+            for (view, method), histogram in sorted(self.latency.items()):
+                labels = _labels(view=view, method=method)
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+            for name, kind, help_text, values in (
+                ('http_response_size_bytes_total', 'counter', 'Response body bytes sent.', self.response_bytes),
+                ('db_queries_total', 'counter', 'SQL queries run while serving requests.', self.queries),
+                ('db_query_duration_seconds_total', 'counter', 'Time spent in SQL queries.', self.db_seconds),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for (view, method), value in sorted(values.items()):
+                    lines.append(f'{name}{{{_labels(view=view, method=method)}}} {value}')
+
+            lines += ['# HELP cache_lookups_total Cache lookups made while serving requests.',
+                      '# TYPE cache_lookups_total counter']
+            for (view, result), count in sorted(self.cache.items()):
+                cache, outcome = result.rsplit('-', 1)
+                lines.append(f'cache_lookups_total{{{_labels(view=view, cache=cache, result=outcome)}}} {count}')
+        return lines
+
+
+registry = Registry()
+
+
+def _view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view_func = match.func
+    # DRF viewsets map methods to actions (list, retrieve, refresh, image, ...)
+    actions = getattr(view_func, 'actions', None)
+    if actions is not None:
+        return actions.get(request.method.lower(), 'unknown')
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    return getattr(view_class or view_func, '__name__', 'unknown')
+
+
+class MetricsMiddleware:
+    """Outermost middleware: times the request, counts its queries and records the result."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Under ASGI, stay async so async views run without a hop to a thread
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    def _finish(self, request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        view = _view_name(request)
+        method = _method(request)
+
+        timing = [f'app;dur={elapsed * 1000:.1f}', f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"']
+        timing += [f'cache;desc="{result}"' for result in stats.cache]
+        response['Server-Timing'] = ', '.join(timing)
+
+        if response.streaming:
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(
+                response.streaming_content, view, method, response.status_code, start, stats)
+        else:
+            registry.observe(view, method, response.status_code, elapsed, len(response.content), stats)
+        return response
+
+    def _stream(self, content, view, method, status, start, stats):
+        # Streamed bodies are produced after the view returns; record once they are sent.
+        # The stats are made current only while the next chunk is produced.
+        size = 0
+        content = iter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    chunk = next(content, None)
+                finally:
+                    _current.reset(token)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe(view, method, status, time.perf_counter() - start, size, stats)
+
+    async def _astream(self, content, view, method, status, start, stats):
+        size = 0
+        content = aiter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    chunk = await anext(content, None)
+                finally:
+                    _current.reset(token)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe(view, method, status, time.perf_counter() - start, size, stats)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_checked_at', models.DateTimeField(null=True)),
+                ('last_changed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
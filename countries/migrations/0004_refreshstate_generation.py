@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0003_refreshjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshstate',
+            name='generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
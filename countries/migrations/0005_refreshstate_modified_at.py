@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0004_refreshstate_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshstate',
+            name='modified_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
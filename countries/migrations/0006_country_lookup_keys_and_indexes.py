@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+def populate_lookup_keys(apps, schema_editor):
+    Country = apps.get_model('countries', 'Country')
+    countries = list(Country.objects.only('name', 'region', 'currency_code'))
+    for country in countries:
+        country.name_key = country.name.casefold()
+        country.region_key = country.region.casefold() if country.region else country.region
+        country.currency_key = country.currency_code.casefold() if country.currency_code else country.currency_code
+    Country.objects.bulk_update(countries, ['name_key', 'region_key', 'currency_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0005_refreshstate_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='currency_key',
+            field=models.CharField(editable=False, max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='region_key',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_lookup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['name_key'], name='country_name_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['region_key'], name='country_region_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['currency_key'], name='country_currency_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['estimated_gdp'], name='country_gdp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['last_refreshed_at'], name='country_refreshed_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0006_country_lookup_keys_and_indexes'),
+    ]
+
+    # Composite indexes are created before the single-column ones they replace are dropped,
+    # so the filters never run without an index.
+    operations = [
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['region_key', 'estimated_gdp'], name='country_region_gdp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['currency_key', 'estimated_gdp'], name='country_currency_gdp_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='country',
+            name='country_region_key_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='country',
+            name='country_currency_key_idx',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0007_country_filter_gdp_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_countries', models.PositiveIntegerField(default=0)),
+                ('last_refreshed_at', models.DateTimeField(null=True)),
+                ('top_by_gdp', models.JSONField(default=list)),
+                ('by_region', models.JSONField(default=list)),
+                ('by_currency', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'country stats',
+            },
+        ),
+    ]
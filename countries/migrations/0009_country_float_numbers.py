@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0008_countrystats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='country',
+            name='estimated_gdp',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='exchange_rate',
+            field=models.FloatField(null=True),
+        ),
+    ]
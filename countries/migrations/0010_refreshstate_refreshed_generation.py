@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0009_country_float_numbers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshstate',
+            name='refreshed_generation',
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+    ]
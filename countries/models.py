@@ -1,4 +1,24 @@
+import uuid
+
 from django.db import models
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def lookup_key(value):
+    """Case-folded form stored in the *_key columns, so case-insensitive filters can use an index."""
+    return value.casefold() if value else value
+
+
+class CountryQuerySet(models.QuerySet):
+    def by_name(self, name):
+        return self.filter(name_key=lookup_key(name))
+
+    def by_region(self, region):
+        return self.filter(region_key=lookup_key(region))
+
+    def by_currency(self, currency_code):
+        return self.filter(currency_key=lookup_key(currency_code))
+
 
 class Country(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -6,14 +26,116 @@ class Country(models.Model):
     region = models.CharField(max_length=255, null=True, blank=True)
     population = models.BigIntegerField()
     currency_code = models.CharField(max_length=3, null=True)
-    exchange_rate = models.DecimalField(max_digits=20, decimal_places=2, null=True)
-    estimated_gdp = models.DecimalField(max_digits=20, decimal_places=2, null=True)
+    # DOUBLE columns: refresh computes floats, the API emits floats, and two decimal places
+    # were too few for rates of strong currencies
+    exchange_rate = models.FloatField(null=True)
+    estimated_gdp = models.FloatField(null=True)
     flag_url = models.URLField(null=True, blank=True)
+    # Bumped whenever the row is written; refresh leaves rows with an unchanged fingerprint alone
     last_refreshed_at = models.DateTimeField(auto_now=True)
+    # Hash of the upstream fields this row was last written from (see refresh.fingerprint)
+    fingerprint = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # Normalized copies of name/region/currency_code; `iexact` can't use an index on MySQL
+    name_key = models.CharField(max_length=255, default='', editable=False)
+    region_key = models.CharField(max_length=255, null=True, editable=False)
+    currency_key = models.CharField(max_length=3, null=True, editable=False)
+
+    objects = CountryQuerySet.as_manager()
+
+    LOOKUP_KEY_FIELDS = ['name_key', 'region_key', 'currency_key']
 
     class Meta:
         verbose_name_plural = "countries"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name_key'], name='country_name_key_idx'),
+            # Serve the region/currency filters and, combined with sort=gdp_desc, its ordering
+            models.Index(fields=['region_key', 'estimated_gdp'], name='country_region_gdp_idx'),
+            models.Index(fields=['currency_key', 'estimated_gdp'], name='country_currency_gdp_idx'),
+            models.Index(fields=['estimated_gdp'], name='country_gdp_idx'),
+            models.Index(fields=['last_refreshed_at'], name='country_refreshed_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    def set_lookup_keys(self):
+        """Call before bulk writes, which bypass save()."""
+        self.name_key = lookup_key(self.name) or ''
+        self.region_key = lookup_key(self.region)
+        self.currency_key = lookup_key(self.currency_code)
+
+    def save(self, *args, **kwargs):
+        self.set_lookup_keys()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.LOOKUP_KEY_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class RefreshState(models.Model):
+    """Single row recording when refresh last ran and when it last changed any country."""
+    last_checked_at = models.DateTimeField(null=True)
+    last_changed_at = models.DateTimeField(null=True)
+    # Incremented on every write to Country; response caches and ETags are keyed on it
+    generation = models.PositiveBigIntegerField(default=0)
+    # When the generation last changed, i.e. Last-Modified for list responses
+    modified_at = models.DateTimeField(null=True)
+    # The generation the last refresh left the data at. Any other value means countries were
+    # written locally since, so an unchanged upstream is no reason to skip the next diff.
+    refreshed_generation = models.PositiveBigIntegerField(null=True)
+
+    @classmethod
+    def get(cls):
+        return cls.objects.filter(pk=1).first()
+
+
+class CountryStats(models.Model):
+    """
+    Single row of aggregates kept up to date by every write to Country (see stats.py),
+    so /status and /countries/stats don't have to scan the table.
+    """
+    total_countries = models.PositiveIntegerField(default=0)
+    last_refreshed_at = models.DateTimeField(null=True)
+    # [{"name", "estimated_gdp"}], highest GDP first
+    top_by_gdp = models.JSONField(default=list)
+    # [{"region"/"currency_code", "countries", "estimated_gdp"}]
+    by_region = models.JSONField(default=list)
+    by_currency = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "country stats"
+
+
+class RefreshJob(models.Model):
+    """
+    One POST /countries/refresh run. Synchronous refreshes run in the request; ?async=1 ones
+    are queued and run by the local worker.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE = [QUEUED, RUNNING]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Current pipeline stage while running (fetching, writing)
+    stage = models.CharField(max_length=32, blank=True, default='')
+    force = models.BooleanField(default=False)
+    # HTTP status and body the synchronous refresh would have returned
+    status_code = models.PositiveSmallIntegerField(null=True)
+    result = models.JSONField(null=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
@@ -0,0 +1,101 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Country
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+class CountryKeysetPagination(BasePagination):
+    """
+    Opt-in keyset pagination for GET /countries (?limit= and ?cursor=).
+
+    Each page continues after the last row's sort key instead of using an OFFSET, so
+    every page is a range scan on an index: `name` (unique) for the default ordering and
+    `estimated_gdp` (with the primary key as tiebreaker, which InnoDB and SQLite indexes
+    carry implicitly) for sort=gdp_desc.
+    """
+    default_limit = 50
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.gdp_desc = request.query_params.get('sort') == 'gdp_desc'
+
+        if self.gdp_desc:
+            # after() relies on NULLs coming last; PostgreSQL puts them first in DESC by default
+            queryset = queryset.order_by(F('estimated_gdp').desc(nulls_last=True), '-id')
+        else:
+            queryset = queryset.order_by('name')
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_limit(self, request):
+        raw = request.query_params.get('limit')
+        if raw in (None, ''):
+            return self.default_limit
+        try:
+            limit = int(raw)
+        except ValueError:
+            raise InvalidPage('limit must be an integer')
+        if not 1 <= limit <= self.max_limit:
+            raise InvalidPage(f'limit must be between 1 and {self.max_limit}')
+        return limit
+
+    def position(self, country):
+        if self.gdp_desc:
+            gdp = country.estimated_gdp
+            return [None if gdp is None else str(gdp), country.pk]
+        return [country.name]
+
+    def after(self, position):
+        if not self.gdp_desc:
+            return Q(name__gt=position[0])
+        gdp, pk = position
+        if gdp is None:
+            return Q(estimated_gdp__isnull=True, id__lt=pk)
+        return Q(estimated_gdp__lt=gdp) | Q(estimated_gdp=gdp, id__lt=pk) | Q(estimated_gdp__isnull=True)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if self.gdp_desc:
+                gdp, pk = position
+                gdp = None if gdp is None else Country._meta.get_field('estimated_gdp').to_python(gdp)
+                return [gdp, int(pk)]
+            name, = position
+            return [str(name)]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidPage('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, 'cursor', self.encode_cursor(self.position(self.last)))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
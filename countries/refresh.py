@@ -0,0 +1,193 @@
+import hashlib
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+
+from .cache import get_generation
+from .models import Country, CountryStats, RefreshState
+from .stats import countries_changed, get_last_refreshed_at
+from .summary import schedule_summary_image
+from .transform import build_records
+from .upstream import UpstreamError, fetch_upstream
+
+# Rows per INSERT/UPDATE statement; keeps packets well under MySQL's max_allowed_packet.
+BULK_BATCH_SIZE = 500
+
+UPSTREAM_FIELDS = [
+    'capital', 'region', 'population', 'currency_code',
+    'exchange_rate', 'estimated_gdp', 'flag_url',
+]
+
+# estimated_gdp is left out on purpose: it's re-rolled with a random multiplier on every
+# refresh, so including it would make every row look changed.
+FINGERPRINT_FIELDS = ['capital', 'region', 'population', 'currency_code', 'exchange_rate', 'flag_url']
+
+
+def fingerprint(record):
+    """Stable hash of the upstream values a country row is derived from."""
+    raw = '\x1f'.join('' if record[name] is None else repr(record[name]) for name in FINGERPRINT_FIELDS)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _bulk_overwrite(countries, now, batch_size):
+    update_fields = UPSTREAM_FIELDS + ['fingerprint', 'last_refreshed_at'] + Country.LOOKUP_KEY_FIELDS
+    features = connection.features
+    if features.supports_update_conflicts:
+        # INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT DO UPDATE: one flat statement per
+        # chunk, far cheaper than the CASE WHEN ladder bulk_update generates.
+        unique_fields = ['name'] if features.supports_update_conflicts_with_target else None
+        Country.objects.bulk_create(
+            countries, batch_size=batch_size, update_conflicts=True,
+            unique_fields=unique_fields, update_fields=update_fields,
+        )
+        return
+    # bulk_update bypasses auto_now, so stamp the refresh time explicitly
+    for country in countries:
+        country.last_refreshed_at = now
+    Country.objects.bulk_update(countries, update_fields, batch_size=batch_size)
+
+
+def _load_index(records, batch_size):
+    """Stored (pk, name, fingerprint) for the names in `records`, keyed by case-folded name."""
+    keys = list({record['name'].casefold() for record in records})
+    index = {}
+    for start in range(0, len(keys), batch_size):
+        for pk, name, stored in Country.objects.filter(name_key__in=keys[start:start + batch_size]).values_list(
+                'pk', 'name', 'fingerprint'):
+            index[name.casefold()] = (pk, name, stored)
+    return index
+
+
+def write_records(records, batch_size=BULK_BATCH_SIZE, now=None):
+    """
+    Write records with a fixed number of queries per batch instead of one SELECT + save per row.
+
+    The stored rows for the records' names are loaded into a case-folded name index and each
+    record's fingerprint is compared with the stored one. Only new and changed rows are
+    written, with chunked bulk inserts/upserts; unchanged rows are not touched at all. Must
+    be called inside a transaction. Returns inserted/updated/unchanged counts.
+    """
+    index = _load_index(records, batch_size)
+
+    to_create = {}
+    to_update = {}
+    for record in records:
+        key = record['name'].casefold()
+        values = {name: record[name] for name in UPSTREAM_FIELDS}
+        values['fingerprint'] = fingerprint(record)
+
+        if key in to_create:
+            # Duplicate name in the payload: last one wins, as with the per-row loop
+            for name, value in values.items():
+                setattr(to_create[key], name, value)
+            continue
+
+        if key not in index:
+            to_create[key] = Country(name=record['name'], **values)
+            continue
+
+        pk, name, stored = index[key]
+        if key in to_update or stored != values['fingerprint']:
+            # Keep the stored spelling of the name, as the per-row save() did
+            to_update[key] = Country(pk=pk, name=name, **values)
+
+    for country in [*to_create.values(), *to_update.values()]:
+        country.set_lookup_keys()
+
+    now = now or timezone.now()
+    if to_create:
+        Country.objects.bulk_create(to_create.values(), batch_size=batch_size)
+    if to_update:
+        _bulk_overwrite(list(to_update.values()), now, batch_size)
+
+    return {
+        'inserted': len(to_create),
+        'updated': len(to_update),
+        'unchanged': len({record['name'].casefold() for record in records}) - len(to_create) - len(to_update),
+    }
+
+
+def upsert_countries(records, batch_size=BULK_BATCH_SIZE):
+    """write_records for a refresh run: also records the run on RefreshState and updates stats."""
+    now = timezone.now()
+    counts = write_records(records, batch_size, now)
+    changed = bool(counts['inserted'] or counts['updated'])
+    if changed:
+        countries_changed()
+    # After countries_changed(), so the generation recorded is the one this run produced
+    mark_checked(now, changed)
+    return counts
+
+
+def mark_checked(now=None, changed=False):
+    """Record a refresh run; `changed` says whether it wrote any country."""
+    now = now or timezone.now()
+    defaults = {'last_checked_at': now, 'refreshed_generation': get_generation()}
+    if changed:
+        defaults['last_changed_at'] = now
+    RefreshState.objects.update_or_create(pk=1, defaults=defaults)
+    CountryStats.objects.filter(pk=1).update(last_refreshed_at=now)
+
+
+def refreshed_data_untouched():
+    """Whether Country still holds exactly what the last refresh left in it."""
+    state = RefreshState.get()
+    return state is not None and state.refreshed_generation == state.generation and Country.objects.exists()
+
+
+def run_refresh(force=False, progress=None, snapshot_dir=None):
+    """
+    The whole refresh pipeline: fetch upstream, write countries, render the summary image.
+
+    Returns (status_code, body) for the HTTP response. `progress`, if given, is called with
+    the name of each stage as it starts so background jobs can report it. `snapshot_dir`
+    replays upstream responses saved as files instead of contacting the sources.
+    """
+    progress = progress or (lambda stage: None)
+
+    # Fetch external data first. If either external API fails, do not modify DB.
+    progress('fetching')
+    try:
+        countries_resp, rates_resp = fetch_upstream(force=force, snapshot_dir=snapshot_dir)
+    except UpstreamError as e:
+        return status.HTTP_503_SERVICE_UNAVAILABLE, {"error": "External data source unavailable", "details": e.details}
+
+    # Nothing changed upstream since the last successful refresh, and nothing was written
+    # locally since either (deletes and edits bump the generation) — skip the DB pass
+    if not (force or countries_resp.changed or rates_resp.changed) and refreshed_data_untouched():
+        countries_resp.save()
+        rates_resp.save()
+        mark_checked()
+        total_countries = Country.objects.count()
+        return status.HTTP_200_OK, {
+            'message': 'Countries data already up to date',
+            'total_countries': total_countries,
+            'last_refreshed_at': get_last_refreshed_at(),
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': total_countries,
+        }
+
+    # Both external APIs are OK — proceed to update DB inside a transaction
+    try:
+        progress('writing')
+        records = build_records(countries_resp.body, rates_resp.body['rates'])
+        with transaction.atomic():
+            counts = upsert_countries(records)
+
+        # Only remember the new upstream state once it has been applied
+        countries_resp.save()
+        rates_resp.save()
+
+        # The image is re-rendered (if its contents changed) off the request path
+        schedule_summary_image()
+
+        return status.HTTP_200_OK, {
+            'message': 'Countries data refreshed successfully',
+            'total_countries': Country.objects.count(),
+            'last_refreshed_at': get_last_refreshed_at(),
+            **counts,
+        }
+    except Exception as e:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Internal server error', 'details': str(e)}
@@ -0,0 +1,170 @@
+"""
+GET /countries/search?q=: type-ahead over country names and capitals.
+
+Each worker keeps an in-memory index of the whole table, built on first use and rebuilt
+when the data generation changes (any write, including refresh). Matching ignores case,
+accents and punctuation:
+
+1. names, then capitals, starting with the query (sorted keys + bisect);
+2. names, then capitals, with a later word starting with it ("kingdom");
+3. fuzzy trigram matches, best first, for typos ("nigera").
+
+Each tier is read in order only until `limit` results are found.
+"""
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from .encoders import FIELDS
+from .metrics import note_cache
+from .models import Country
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Minimum trigram similarity (shared / union) for a fuzzy match; pg_trgm's default
+FUZZY_THRESHOLD = 0.3
+# Fuzzy keys scored per lookup at most
+MAX_FUZZY_CANDIDATES = 500
+
+_NAME_INDEX = FIELDS.index('name')
+_CAPITAL_INDEX = FIELDS.index('capital')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Comparison form: accents stripped, case-folded, punctuation collapsed to single spaces."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_NON_WORD.sub(' ', stripped.casefold()).split())
+
+
+def trigrams(key):
+    # Padded like pg_trgm, so word starts weigh more than word middles
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_limit(value):
+    """?limit= as an int in 1..MAX_LIMIT (DEFAULT_LIMIT if missing). Raises ValueError."""
+    if value in (None, ''):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'must be an integer between 1 and {MAX_LIMIT}')
+    return limit
+
+
+class SearchIndex:
+    """Immutable index over `.values_list(*FIELDS)` rows; `search` returns rows."""
+
+    def __init__(self, rows):
+        # Rows come sorted by name, so row order breaks ties alphabetically
+        self.rows = rows
+        # (key, row) lists: full names, full capitals, later words of names, of capitals
+        self.prefixes = [[], [], [], []]
+        # Fuzzy matching: key id -> (row, trigrams, trigram count), precomputed so a lookup only
+        # intersects (tuples, not sets: 200k sets made the build's GC passes ~70% slower);
+        # trigram -> key ids
+        self.keys = []
+        self.postings = defaultdict(list)
+        for row_id, row in enumerate(rows):
+            for tier, value in ((0, row[_NAME_INDEX]), (1, row[_CAPITAL_INDEX])):
+                key = normalize(value)
+                if not key:
+                    continue
+                self.prefixes[tier].append((key, row_id))
+                for position, char in enumerate(key):
+                    if char == ' ':
+                        self.prefixes[tier + 2].append((key[position + 1:], row_id))
+                grams = tuple(trigrams(key))
+                key_id = len(self.keys)
+                self.keys.append((row_id, grams, len(grams)))
+                for gram in grams:
+                    self.postings[gram].append(key_id)
+        for keys in self.prefixes:
+            keys.sort()
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        query = normalize(query)
+        if not query:
+            return []
+        # Insertion-ordered set of row ids
+        found = {}
+        for keys in self.prefixes:
+            i = bisect_left(keys, (query,))
+            while i < len(keys) and len(found) < limit:
+                key, row_id = keys[i]
+                if not key.startswith(query):
+                    break
+                found[row_id] = None
+                i += 1
+        if len(found) < limit and len(query) >= 3:
+            for row_id in self._fuzzy(query):
+                found[row_id] = None
+                if len(found) >= limit:
+                    break
+        return [self.rows[row_id] for row_id in found]
+
+    def _fuzzy(self, query):
+        grams = trigrams(query)
+        # Rarest first. A key sharing fewer than `needed` of the query's trigrams can't reach
+        # the threshold, so every match contains one of the first len - needed + 1 of them.
+        ordered = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+        needed = math.ceil(FUZZY_THRESHOLD * len(grams))
+        candidates = set()
+        for gram in ordered[:len(ordered) - needed + 1]:
+            postings = self.postings.get(gram, ())
+            if candidates and len(candidates) + len(postings) > MAX_FUZZY_CANDIDATES:
+                # Too unspecific to score every candidate; keep the lookup bounded
+                break
+            candidates.update(postings)
+        best = {}
+        size = len(grams)
+        for key_id in candidates:
+            row_id, key_grams, key_size = self.keys[key_id]
+            shared = len(grams.intersection(key_grams))
+            score = shared / (size + key_size - shared)
+            if score >= FUZZY_THRESHOLD and score > best.get(row_id, 0):
+                best[row_id] = score
+        return sorted(best, key=lambda row_id: (-best[row_id], row_id))
+
+
+class SearchIndexCache:
+    """The current SearchIndex of this process, tagged with the generation it was built from."""
+
+    def __init__(self):
+        self._current = (None, None)
+        self._lock = threading.Lock()
+
+    def current(self, generation):
+        """The index for `generation` if it is already built, else None (no database access)."""
+        built_for, index = self._current
+        return index if built_for == generation else None
+
+    def get(self, generation):
+        index = self.current(generation)
+        note_cache('search', index is not None)
+        if index is not None:
+            return index
+        with self._lock:
+            # Another thread may have built it while this one waited
+            index = self.current(generation)
+            if index is None:
+                rows = list(Country.objects.order_by('name').values_list(*FIELDS))
+                index = SearchIndex(rows)
+                self._current = (generation, index)
+        return index
+
+    def clear(self):
+        self._current = (None, None)
+
+
+search_index = SearchIndexCache()
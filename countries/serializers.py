@@ -17,4 +17,20 @@ class CountrySerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'exchange_rate', 'estimated_gdp',
             'last_refreshed_at'
-        ]
\ No newline at end of file
+        ]
+
+    def to_representation(self, instance):
+        # Fast path: every column already comes back from the database as a JSON-ready str,
+        # int or float (or None), so skip the per-field dispatch; only the timestamp needs
+        # formatting.
+        data = {name: getattr(instance, name) for name in self.Meta.fields}
+        if data['last_refreshed_at'] is not None:
+            data['last_refreshed_at'] = self.fields['last_refreshed_at'].to_representation(data['last_refreshed_at'])
+        return data
+
+
+class CountryBulkSerializer(CountrySerializer):
+    """Validates one POST /countries/bulk upsert; bulk.py resolves existing names itself."""
+
+    class Meta(CountrySerializer.Meta):
+        extra_kwargs = {'name': {'validators': []}}
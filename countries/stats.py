@@ -0,0 +1,68 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .cache import bump_generation
+from .models import Country, CountryStats, RefreshState
+
+TOP_N = 5
+
+
+def get_last_refreshed_at():
+    """Time of the last refresh run, falling back to the newest row for older databases."""
+    state = RefreshState.get()
+    if state is not None and state.last_checked_at is not None:
+        return state.last_checked_at
+    last_ref = Country.objects.order_by('-last_refreshed_at').first()
+    return last_ref.last_refreshed_at if last_ref else None
+
+
+def _breakdown(field):
+    rows = (
+        Country.objects.order_by()
+        .values(field)
+        .annotate(countries=Count('id'), estimated_gdp=Sum('estimated_gdp'))
+        .order_by(field)
+    )
+    return [
+        {field: row[field], 'countries': row['countries'], 'estimated_gdp': row['estimated_gdp']}
+        for row in rows
+    ]
+
+
+def recompute_stats():
+    """Rebuild the CountryStats row from the Country table."""
+    with transaction.atomic():
+        # Lock the row before reading the aggregates so concurrent writers
+        # recompute one after another and the last save sees the last write
+        stats, _ = CountryStats.objects.select_for_update().get_or_create(pk=1)
+        top = (
+            Country.objects.filter(estimated_gdp__isnull=False)
+            .order_by('-estimated_gdp')
+            .values_list('name', 'estimated_gdp')[:TOP_N]
+        )
+        stats.total_countries = Country.objects.count()
+        stats.last_refreshed_at = get_last_refreshed_at()
+        stats.top_by_gdp = [{'name': name, 'estimated_gdp': gdp} for name, gdp in top]
+        stats.by_region = _breakdown('region')
+        stats.by_currency = _breakdown('currency_code')
+        stats.save()
+    return stats
+
+
+def get_stats():
+    """The precomputed stats row; built on first use after a fresh migrate."""
+    return CountryStats.objects.filter(pk=1).first() or recompute_stats()
+
+
+async def aget_stats():
+    return await CountryStats.objects.filter(pk=1).afirst() or await sync_to_async(recompute_stats)()
+
+
+def countries_changed():
+    """
+    Call after every write to Country, inside the same transaction: refreshes the
+    precomputed stats and invalidates cached responses.
+    """
+    recompute_stats()
+    bump_generation()
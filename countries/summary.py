@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+
+from .stats import TOP_N, get_stats
+
+logger = logging.getLogger(__name__)
+
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+# Variants written on every render: file extension -> Pillow save options
+VARIANTS = {
+    'png': {'format': 'PNG', 'optimize': True},
+    'webp': {'format': 'WEBP', 'lossless': True, 'method': 4},
+}
+
+# ext -> ((mtime_ns, size), bytes) of the image last read by this process
+_image_bytes = {}
+
+_render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summary-image')
+_queued_lock = threading.Lock()
+_queued = False
+
+
+def summary_path(ext='png'):
+    return os.path.join(settings.BASE_DIR, 'cache', f'summary.{ext}')
+
+
+def read_summary(ext='png'):
+    """
+    ((mtime_ns, size), bytes) of the current image variant, kept in memory until the file
+    changes. The version comes from fstat() of the file actually read, so it always matches
+    the bytes even if a render replaces the file concurrently. Raises FileNotFoundError.
+    """
+    path = summary_path(ext)
+    stat = os.stat(path)
+    cached = _image_bytes.get(ext)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        entry = ((stat.st_mtime_ns, stat.st_size), f.read())
+    _image_bytes[ext] = entry
+    return entry
+
+
+async def aread_summary(ext='png'):
+    """read_summary() for async views: only a changed file is read, in a worker thread."""
+    stat = os.stat(summary_path(ext))
+    cached = _image_bytes.get(ext)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached
+    return await asyncio.to_thread(read_summary, ext)
+
+
+@functools.lru_cache(maxsize=None)
+def _font(size=20):
+    # Parsing the TrueType file is the slowest part of a render; do it once per process
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def summary_inputs():
+    """Everything the image shows apart from the timestamp: total and the top N by GDP."""
+    stats = get_stats()
+    top_countries = [(country['name'], country['estimated_gdp']) for country in stats.top_by_gdp]
+    return stats.total_countries, top_countries
+
+
+def content_hash(total_countries, top_countries):
+    payload = json.dumps([total_countries, [[name, f'{gdp:,.2f}'] for name, gdp in top_countries]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _draw(total_countries, top_countries):
+    width = 800
+    height = 600
+    image = Image.new('RGB', (width, height), color='white')
+    draw = ImageDraw.Draw(image)
+    font = _font()
+
+    # Draw content
+    y_position = 50
+
+    # Total countries
+    draw.text((50, y_position), f'Total Countries: {total_countries}', fill='black', font=font)
+    y_position += 50
+
+    # Top 5 countries by GDP
+    draw.text((50, y_position), f'Top {TOP_N} Countries by GDP:', fill='black', font=font)
+    y_position += 40
+
+    for name, gdp in top_countries:
+        draw.text((70, y_position), f'{name}: ${gdp:,.2f}', fill='black', font=font)
+        y_position += 30
+
+    # Render timestamp: the data last changed at (or just before) this time
+    y_position += 20
+    last_refresh = timezone.now().strftime('%Y-%m-%d %H:%M:%S UTC')
+    draw.text((50, y_position), f'Last Refreshed: {last_refresh}', fill='black', font=font)
+    return image
+
+
+def _atomic_write(path, write):
+    # Readers see either the old file or the new one, never a partially written one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp creates 0600 files; the image may be served directly by a front-end server
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _stored_hash():
+    try:
+        with open(summary_path('hash')) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def generate_summary_image(force=False):
+    """
+    Render the summary image in every format in VARIANTS.
+
+    The render is skipped when the total and top-N are the same as last time and all
+    variants are on disk. Returns True if the image was rendered.
+    """
+    os.makedirs(os.path.dirname(summary_path()), exist_ok=True)
+
+    total_countries, top_countries = summary_inputs()
+    digest = content_hash(total_countries, top_countries)
+    if not force and digest == _stored_hash() and all(os.path.exists(summary_path(ext)) for ext in VARIANTS):
+        return False
+
+    image = _draw(total_countries, top_countries)
+    for ext, options in VARIANTS.items():
+        _atomic_write(summary_path(ext), lambda f: image.save(f, **options))
+    _atomic_write(summary_path('hash'), lambda f: f.write(digest.encode()))
+    return True
+
+
+def _render_job():
+    global _queued
+    # Clear the flag before reading the DB so writes made during this render queue another one
+    with _queued_lock:
+        _queued = False
+    try:
+        generate_summary_image()
+    except Exception:
+        logger.exception('Summary image render failed')
+    finally:
+        connection.close()
+
+
+def schedule_summary_image():
+    """Render the summary image on a background thread; a render already queued covers this call."""
+    global _queued
+    with _queued_lock:
+        if _queued:
+            return
+        _queued = True
+    _render_pool.submit(_render_job)
@@ -1,3 +1,1028 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.db.utils import load_backend
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from . import async_views, bulk, encoders, jobs, summary, transform, upstream
+from .db.pool import close_pools
+from .metrics import MetricsMiddleware, RequestStats, registry
+from .cache import ResponseCache, list_cache
+from .models import Country, RefreshJob, RefreshState
+from .serializers import CountrySerializer
+from .refresh import upsert_countries, write_records
+from .search import search_index
+from .stats import countries_changed, get_last_refreshed_at, get_stats
+from .transform import build_records
+
+COUNTRIES_PAYLOAD = [
+    {'name': 'Nigeria', 'capital': 'Abuja', 'region': 'Africa', 'population': 206139589,
+     'flag': 'https://flagcdn.com/ng.svg', 'currencies': [{'code': 'NGN'}]},
+    {'name': 'Ghana', 'capital': 'Accra', 'region': 'Africa', 'population': 31072940,
+     'flag': 'https://flagcdn.com/gh.svg', 'currencies': [{'code': 'GHS'}]},
+]
+RATES_PAYLOAD = {'result': 'success', 'rates': {'NGN': 1600.23, 'GHS': 15.5}}
+
+
+class StubServer:
+    """Local HTTP server answering GET with a fixed JSON body after an optional delay."""
+
+    def __init__(self, body, delay=0, status_code=200, etag=None):
+        stub = self
+        self.body = json.dumps(body).encode()
+        self.delay = delay
+        self.status_code = status_code
+        self.etag = etag
+        self.hits = 0
+        self.downloads = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                if stub.etag and self.headers.get('If-None-Match') == stub.etag:
+                    self.send_response(304)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                stub.downloads += 1
+                self.send_response(stub.status_code)
+                self.send_header('Content-Type', 'application/json')
+                if stub.etag:
+                    self.send_header('ETag', stub.etag)
+                self.send_header('Content-Length', str(len(stub.body)))
+                self.end_headers()
+                self.wfile.write(stub.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        # Don't make tests wait for slow handlers when shutting down
+        self.server.block_on_close = False
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class UpstreamTestCase(TestCase):
+    def setUp(self):
+        upstream.reset_session()
+        self.addCleanup(upstream.reset_session)
+        # The image renders on a background thread that can't see this test's transaction
+        patcher = mock.patch('countries.refresh.schedule_summary_image')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stub(self, *args, **kwargs):
+        server = StubServer(*args, **kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def upstream_settings(self, countries, rates):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        return override_settings(
+            COUNTRIES_API_URL=countries.url,
+            EXCHANGE_RATES_API_URL=rates.url,
+            UPSTREAM_TIMEOUT=5,
+            UPSTREAM_RETRIES=0,
+            UPSTREAM_CACHE_DIR=cache_dir.name,
+            UPSTREAM_CACHE_TTL=0,
+        )
+
+
+class FetchUpstreamTests(UpstreamTestCase):
+    def test_sources_are_fetched_in_parallel(self):
+        countries = self.stub(COUNTRIES_PAYLOAD, delay=0.5)
+        rates = self.stub(RATES_PAYLOAD, delay=0.5)
+        with self.upstream_settings(countries, rates):
+            start = time.perf_counter()
+            countries_resp, rates_resp = upstream.fetch_upstream()
+            elapsed = time.perf_counter() - start
+        self.assertEqual(countries_resp.body, COUNTRIES_PAYLOAD)
+        self.assertEqual(rates_resp.body, RATES_PAYLOAD)
+        self.assertLess(elapsed, 0.9)
+
+    def test_failing_source_does_not_wait_for_slow_one(self):
+        countries = self.stub(COUNTRIES_PAYLOAD, delay=2)
+        rates = self.stub({}, status_code=500)
+        with self.upstream_settings(countries, rates):
+            start = time.perf_counter()
+            with self.assertRaises(upstream.UpstreamError) as ctx:
+                upstream.fetch_upstream()
+            elapsed = time.perf_counter() - start
+        self.assertIn('exchange rates', ctx.exception.details)
+        self.assertLess(elapsed, 1.5)
+
+    def test_retries_server_errors(self):
+        countries = self.stub(COUNTRIES_PAYLOAD, status_code=503)
+        rates = self.stub(RATES_PAYLOAD)
+        with self.upstream_settings(countries, rates), override_settings(UPSTREAM_RETRIES=2, UPSTREAM_BACKOFF=0):
+            with self.assertRaises(upstream.UpstreamError):
+                upstream.fetch_upstream()
+        self.assertEqual(countries.hits, 3)
+
+
+class RefreshUpstreamTests(UpstreamTestCase):
+    def test_refresh_returns_503_and_leaves_db_untouched(self):
+        Country.objects.create(name='Nigeria', population=1, currency_code='NGN')
+        countries = self.stub(COUNTRIES_PAYLOAD)
+        rates = self.stub({'result': 'error'})
+        with self.upstream_settings(countries, rates):
+            response = self.client.post('/countries/refresh')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['error'], 'External data source unavailable')
+        self.assertEqual(Country.objects.get().population, 1)
+
+    def refresh_twice(self, local_change):
+        countries = self.stub(COUNTRIES_PAYLOAD)
+        rates = self.stub(RATES_PAYLOAD)
+        with self.upstream_settings(countries, rates):
+            self.assertEqual(self.client.post('/countries/refresh').json()['inserted'], 2)
+            local_change()
+            return self.client.post('/countries/refresh').json()
+
+    def test_refresh_restores_deleted_country(self):
+        body = self.refresh_twice(lambda: self.client.delete('/countries/ghana'))
+        self.assertEqual((body['inserted'], body['updated'], body['unchanged']), (1, 0, 1))
+        self.assertEqual(body['message'], 'Countries data refreshed successfully')
+        self.assertTrue(Country.objects.filter(name='Ghana').exists())
+
+    def test_refresh_overwrites_manual_edit(self):
+        def edit():
+            response = self.client.put('/countries/nigeria', {
+                'name': 'Nigeria', 'capital': 'X', 'population': 999, 'currency_code': 'NGN',
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        body = self.refresh_twice(edit)
+        self.assertEqual((body['inserted'], body['updated'], body['unchanged']), (0, 1, 1))
+        nigeria = Country.objects.get(name='Nigeria')
+        self.assertEqual((nigeria.capital, nigeria.population), ('Abuja', 206139589))
+
+    def test_refresh_overwrites_bulk_edit(self):
+        def edit():
+            body = [{'name': 'Ghana', 'capital': 'X', 'population': 999, 'currency_code': 'GHS'}]
+            self.assertEqual(self.client.post('/countries/bulk', body, content_type='application/json').status_code, 200)
+
+        body = self.refresh_twice(edit)
+        self.assertEqual((body['inserted'], body['updated'], body['unchanged']), (0, 1, 1))
+        self.assertEqual(Country.objects.get(name='Ghana').capital, 'Accra')
+
+    def test_unchanged_upstream_skips_db_pass(self):
+        body = self.refresh_twice(lambda: None)
+        self.assertEqual(body['message'], 'Countries data already up to date')
+        self.assertEqual(body['unchanged'], 2)
+
+
+class SnapshotRefreshTests(UpstreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.snapshot = os.path.join(self.tmp, 'snapshot')
+
+    def refresh(self, *args):
+        out = io.StringIO()
+        with override_settings(UPSTREAM_CACHE_DIR=os.path.join(self.tmp, 'cache')):
+            call_command('refresh_countries', *args, stdout=out)
+        return out.getvalue()
+
+    def test_save_and_replay_snapshot(self):
+        countries = self.stub(COUNTRIES_PAYLOAD)
+        rates = self.stub(RATES_PAYLOAD)
+        with self.upstream_settings(countries, rates):
+            self.refresh('--save-snapshot', self.snapshot)
+        self.assertEqual(sorted(os.listdir(self.snapshot)), ['countries.json', 'rates.json'])
+        self.assertFalse(Country.objects.exists())
+
+        self.assertIn('"inserted": 2', self.refresh('--from-snapshot', self.snapshot))
+        self.assertIn('already up to date', self.refresh('--from-snapshot', self.snapshot))
+        self.assertIn('run 2/2', self.refresh('--from-snapshot', self.snapshot, '--repeat', '2'))
+        self.assertEqual(Country.objects.get(name='Ghana').exchange_rate, 15.5)
+        # Every run went through the single-flight job queue
+        self.assertEqual(RefreshJob.objects.filter(status=RefreshJob.SUCCEEDED).count(), 4)
+
+    def test_sources_can_be_files(self):
+        os.makedirs(self.snapshot)
+        for source, payload in (('countries', COUNTRIES_PAYLOAD), ('rates', RATES_PAYLOAD)):
+            with open(os.path.join(self.snapshot, f'{source}.json'), 'w') as f:
+                json.dump(payload, f)
+        with override_settings(COUNTRIES_API_URL=os.path.join(self.snapshot, 'countries.json'),
+                               EXCHANGE_RATES_API_URL=Path(self.snapshot, 'rates.json').as_uri()):
+            self.refresh()
+        self.assertEqual(Country.objects.count(), 2)
+
+    def test_missing_snapshot_fails_without_writing(self):
+        with self.assertRaisesMessage(CommandError, 'External data source unavailable'):
+            self.refresh('--from-snapshot', self.snapshot)
+        self.assertFalse(Country.objects.exists())
+
+
+class UpstreamCacheTests(UpstreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.countries = self.stub(COUNTRIES_PAYLOAD, etag='"countries-v1"')
+        self.rates = self.stub(RATES_PAYLOAD)
+        settings_override = self.upstream_settings(self.countries, self.rates)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_unchanged_upstream_skips_download_and_db_pass(self):
+        first = self.client.post('/countries/refresh').json()
+        self.assertEqual(first['inserted'], 2)
+
+        second = self.client.post('/countries/refresh').json()
+        self.assertEqual(second['message'], 'Countries data already up to date')
+        self.assertEqual(second['unchanged'], 2)
+        # Countries revalidated with If-None-Match, rates body compared by digest
+        self.assertEqual(self.countries.hits, 2)
+        self.assertEqual(self.countries.downloads, 1)
+
+    def test_ttl_avoids_contacting_sources(self):
+        self.client.post('/countries/refresh')
+        with override_settings(UPSTREAM_CACHE_TTL=60):
+            self.client.post('/countries/refresh')
+        self.assertEqual(self.countries.hits, 1)
+        self.assertEqual(self.rates.hits, 1)
+
+    def test_force_bypasses_cache(self):
+        self.client.post('/countries/refresh')
+        response = self.client.post('/countries/refresh?force=1').json()
+        self.assertEqual(response['message'], 'Countries data refreshed successfully')
+        self.assertEqual(self.countries.downloads, 2)
+
+
+class TransformTests(TestCase):
+    PAYLOAD = COUNTRIES_PAYLOAD + [
+        {'name': 'Antarctica', 'population': 1000, 'currencies': []},
+        {'name': 'Atlantis', 'population': 10, 'currencies': [{'code': 'ATL'}]},
+        {'name': 'Nowhere', 'population': 0, 'currencies': [{'code': 'NGN'}]},
+        {'name': '', 'population': 5},
+    ]
+
+    def check_backend(self):
+        records = build_records(self.PAYLOAD, RATES_PAYLOAD['rates'], seed=42)
+        self.assertEqual(records, build_records(self.PAYLOAD, RATES_PAYLOAD['rates'], seed=42))
+        by_name = {record['name']: record for record in records}
+        self.assertEqual(list(by_name), ['Nigeria', 'Ghana', 'Antarctica', 'Atlantis', 'Nowhere'])
+
+        nigeria = by_name['Nigeria']
+        self.assertEqual(nigeria['exchange_rate'], 1600.23)
+        self.assertTrue(206139589 * 1000 / 1600.23 <= nigeria['estimated_gdp'] <= 206139589 * 2000 / 1600.23)
+        self.assertEqual((by_name['Antarctica']['currency_code'], by_name['Antarctica']['estimated_gdp']), (None, 0))
+        self.assertEqual((by_name['Atlantis']['exchange_rate'], by_name['Atlantis']['estimated_gdp']), (None, None))
+        self.assertIsNone(by_name['Nowhere']['estimated_gdp'])
+
+    def test_seeded_output_is_reproducible(self):
+        self.check_backend()
+
+    def test_pure_python_fallback(self):
+        with mock.patch.object(transform, 'np', None):
+            self.check_backend()
+
+
+class UpsertCountriesTests(TestCase):
+    def refresh(self, rates):
+        with transaction.atomic():
+            return upsert_countries(build_records(COUNTRIES_PAYLOAD, rates))
+
+    def test_only_changed_rows_are_written(self):
+        self.assertEqual(self.refresh(RATES_PAYLOAD['rates'])['inserted'], 2)
+        before = dict(Country.objects.values_list('name', 'last_refreshed_at'))
+
+        counts = self.refresh({'NGN': 1500.0, 'GHS': 15.5})
+        self.assertEqual(counts, {'inserted': 0, 'updated': 1, 'unchanged': 1})
+        after = dict(Country.objects.values_list('name', 'last_refreshed_at'))
+        self.assertEqual(after['Ghana'], before['Ghana'])
+        self.assertGreater(after['Nigeria'], before['Nigeria'])
+
+        state = RefreshState.get()
+        self.assertGreater(state.last_changed_at, before['Nigeria'])
+        self.assertEqual(get_last_refreshed_at(), state.last_checked_at)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(rows):
+            Country.objects.all().delete()
+            payload = [{**COUNTRIES_PAYLOAD[0], 'name': f'Country {i}'} for i in range(rows)]
+            records = build_records(payload, RATES_PAYLOAD['rates'])
+            with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+                write_records(records)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(5), queries(50))
+
+    def test_names_match_case_insensitively_and_last_duplicate_wins(self):
+        self.refresh(RATES_PAYLOAD['rates'])
+        payload = [
+            {**COUNTRIES_PAYLOAD[0], 'name': 'NIGERIA', 'capital': 'Lagos'},
+            {**COUNTRIES_PAYLOAD[1], 'capital': 'Kumasi'},
+            {**COUNTRIES_PAYLOAD[1], 'capital': 'Tamale'},
+        ]
+        with transaction.atomic():
+            counts = upsert_countries(build_records(payload, RATES_PAYLOAD['rates']))
+        self.assertEqual(counts, {'inserted': 0, 'updated': 2, 'unchanged': 0})
+        # The stored spelling of the name is kept
+        self.assertEqual(dict(Country.objects.values_list('name', 'capital')), {'Nigeria': 'Lagos', 'Ghana': 'Tamale'})
+
+
+class RefreshJobTests(TestCase):
+    def test_async_refresh_coalesces_onto_active_job(self):
+        active = RefreshJob.objects.create(status=RefreshJob.RUNNING)
+        response = self.client.post('/countries/refresh?async=1')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['job_id'], str(active.pk))
+        self.assertTrue(response.json()['coalesced'])
+        self.assertEqual(RefreshJob.objects.count(), 1)
+
+    @override_settings(REFRESH_JOB_TIMEOUT=60)
+    def test_stale_job_is_failed_and_replaced(self):
+        stale = RefreshJob.objects.create(status=RefreshJob.RUNNING)
+        RefreshJob.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch.object(jobs, '_worker') as worker:
+            job, created = jobs.submit_refresh()
+        self.assertTrue(created)
+        worker.submit.assert_called_once_with(jobs._run_job, job.pk)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, RefreshJob.FAILED)
+
+    def test_sync_refresh_waits_for_active_job(self):
+        active = RefreshJob.objects.create(status=RefreshJob.RUNNING)
+
+        def finish(seconds):
+            RefreshJob.objects.filter(pk=active.pk).update(
+                status=RefreshJob.SUCCEEDED, status_code=200, result={'inserted': 2})
+
+        with mock.patch.object(jobs.time, 'sleep', side_effect=finish), \
+                mock.patch('countries.jobs.run_refresh') as run_refresh:
+            response = self.client.post('/countries/refresh')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'inserted': 2})
+        run_refresh.assert_not_called()
+        self.assertEqual(RefreshJob.objects.count(), 1)
+
+    def test_sync_refresh_is_recorded_as_job(self):
+        with mock.patch('countries.jobs.run_refresh', return_value=(200, {'inserted': 2})):
+            response = self.client.post('/countries/refresh')
+        self.assertEqual(response.json(), {'inserted': 2})
+        job = RefreshJob.objects.get()
+        self.assertEqual((job.status, job.status_code), (RefreshJob.SUCCEEDED, 200))
+
+    def test_job_status(self):
+        job = RefreshJob.objects.create(status=RefreshJob.SUCCEEDED, status_code=200, result={'inserted': 2})
+        response = self.client.get(f'/countries/refresh/{job.pk}')
+        self.assertEqual(response.json()['status'], 'succeeded')
+        self.assertEqual(response.json()['result'], {'inserted': 2})
+        missing = self.client.get('/countries/refresh/00000000-0000-0000-0000-000000000000')
+        self.assertEqual(missing.status_code, 404)
+        for job_id in ('not-a-uuid', '-' * 36):
+            invalid = self.client.get(f'/countries/refresh/{job_id}')
+            self.assertEqual((invalid.status_code, invalid.json()), (404, {'error': 'Refresh job not found'}))
+
+
+class ListCacheTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        Country.objects.create(name='Nigeria', region='Africa', population=1, currency_code='NGN')
+
+    def test_repeated_list_is_served_from_cache(self):
+        first = self.client.get('/countries?region=africa')
+        with self.assertNumQueries(1):
+            second = self.client.get('/countries?region=AFRICA')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.client.get('/status').json()['list_cache']['hits'], 1)
+
+    def test_writes_invalidate_cache(self):
+        self.client.get('/countries')
+        self.client.post('/countries', {'name': 'Ghana', 'population': 2, 'currency_code': 'GHS'},
+                         content_type='application/json')
+        self.assertEqual([c['name'] for c in self.client.get('/countries').json()], ['Ghana', 'Nigeria'])
+        self.client.delete('/countries/ghana')
+        self.assertEqual([c['name'] for c in self.client.get('/countries').json()], ['Nigeria'])
+
+    def test_lru_eviction_respects_size_bound(self):
+        cache = ResponseCache(max_entries=10, max_bytes=10)
+        cache.get('a', 1)
+        cache.set('a', 1, b'12345')
+        cache.set('b', 1, b'12345')
+        cache.get('a', 1)
+        cache.set('c', 1, b'12345')
+        self.assertEqual(cache.get('b', 1), None)
+        self.assertEqual(cache.get('a', 1), b'12345')
+        self.assertEqual(cache.stats()['bytes'], 10)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        Country.objects.create(name='Nigeria', region='Africa', population=1, currency_code='NGN')
+
+    def test_list_not_modified_until_write(self):
+        response = self.client.get('/countries?region=Africa')
+        etag = response.headers['ETag']
+        self.assertIn('max-age', response.headers['Cache-Control'])
+
+        not_modified = self.client.get('/countries?region=Africa', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertNotEqual(self.client.get('/countries', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.put('/countries/nigeria', {'name': 'Nigeria', 'population': 2, 'currency_code': 'NGN'},
+                        content_type='application/json')
+        self.assertEqual(self.client.get('/countries?region=Africa', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_retrieve_etag_and_last_modified(self):
+        response = self.client.get('/countries/nigeria')
+        self.assertIn('Last-Modified', response.headers)
+        self.assertEqual(
+            self.client.get('/countries/Nigeria', HTTP_IF_NONE_MATCH=response.headers['ETag']).status_code, 304
+        )
+        self.assertEqual(
+            self.client.get('/countries/nigeria', HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified']).status_code,
+            304,
+        )
+
+
+class LookupIndexTests(TestCase):
+    def setUp(self):
+        Country.objects.create(name='Côte d\'Ivoire', region='Africa', population=1, currency_code='XOF')
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_lookup_keys_are_maintained_on_save(self):
+        country = Country.objects.by_name("CÔTE D'IVOIRE").get()
+        self.assertEqual((country.region_key, country.currency_key), ('africa', 'xof'))
+        country.currency_code = 'EUR'
+        country.save(update_fields=['currency_code'])
+        self.assertTrue(Country.objects.by_currency('eur').exists())
+
+    def test_filters_use_indexes(self):
+        self.assertUsesIndex(Country.objects.by_name('nigeria'), 'country_name_key_idx')
+        self.assertUsesIndex(Country.objects.by_region('africa'), 'country_region_gdp_idx')
+        self.assertUsesIndex(Country.objects.by_currency('ngn'), 'country_currency_gdp_idx')
+        self.assertUsesIndex(Country.objects.order_by('-estimated_gdp'), 'country_gdp_idx')
+        self.assertUsesIndex(Country.objects.order_by('-last_refreshed_at')[:1], 'country_refreshed_idx')
+
+
+class CountryStatsTests(TestCase):
+    def setUp(self):
+        Country.objects.create(name='Nigeria', region='Africa', population=10, currency_code='NGN', estimated_gdp=300)
+        Country.objects.create(name='Ghana', region='Africa', population=5, currency_code='GHS', estimated_gdp=100)
+        countries_changed()
+
+    def test_stats_follow_writes(self):
+        stats = self.client.get('/countries/stats').json()
+        self.assertEqual(stats['total_countries'], 2)
+        self.assertEqual([row['name'] for row in stats['top_by_gdp']], ['Nigeria', 'Ghana'])
+        self.assertEqual(stats['by_region'], [{'region': 'Africa', 'countries': 2, 'estimated_gdp': 400.0}])
+
+        self.client.post('/countries', {'name': 'Togo', 'population': 2, 'currency_code': 'XOF'},
+                         content_type='application/json')
+        self.client.delete('/countries/ghana')
+        stats = self.client.get('/countries/stats').json()
+        self.assertEqual(stats['total_countries'], 2)
+        self.assertEqual([row['currency_code'] for row in stats['by_currency']], ['NGN', 'XOF'])
+
+    def test_status_is_a_single_read(self):
+        with self.assertNumQueries(1):
+            body = self.client.get('/status').json()
+        self.assertEqual(body['total_countries'], 2)
+
+
+class BulkTests(TestCase):
+    OPERATIONS = [
+        {'name': 'Ghana', 'capital': 'Accra', 'population': 31072940, 'currency_code': 'GHS'},
+        {'op': 'upsert', 'name': 'NIGERIA', 'capital': 'Abuja', 'population': 7, 'currency_code': 'NGN'},
+        {'op': 'delete', 'name': 'togo'},
+        {'op': 'delete', 'name': 'Atlantis'},
+        {'name': 'Bad', 'population': 'many', 'currency_code': 'BAD'},
+        {'name': 'Côte d\'Ivoire', 'population': 1, 'currency_code': 'XOF'},
+        {'op': 'delete', 'name': 'Ghana'},
+        {'name': 'Ghana', 'population': 2, 'currency_code': 'GHS'},
+    ]
+
+    def setUp(self):
+        for name in ('Nigeria', 'Togo'):
+            Country.objects.create(name=name, population=1, currency_code='XOF', estimated_gdp=5)
+        countries_changed()
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post('/countries/bulk', body, content_type=content_type)
+
+    def check_applied(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual([result['status'] for result in body['results']],
+                         ['created', 'updated', 'deleted', 'not_found', 'error', 'created', 'deleted', 'created'])
+        self.assertEqual((body['created'], body['updated'], body['deleted'], body['error']), (3, 1, 2, 1))
+        self.assertIn('population', body['results'][4]['details'])
+        countries = {country.name: country for country in Country.objects.all()}
+        self.assertEqual(sorted(countries), ['Côte d\'Ivoire', 'Ghana', 'NIGERIA'])
+        self.assertEqual((countries['Ghana'].population, countries['NIGERIA'].capital), (2, 'Abuja'))
+        self.assertEqual(countries['NIGERIA'].estimated_gdp, 5)
+        self.assertEqual(self.client.get('/countries/stats').json()['total_countries'], 3)
+
+    def test_json_array(self):
+        self.check_applied(self.post(json.dumps(self.OPERATIONS)))
+
+    def test_ndjson_read_in_small_chunks(self):
+        body = '\n'.join(json.dumps(op, ensure_ascii=False) for op in self.OPERATIONS)
+        with mock.patch.object(bulk, 'READ_SIZE', 3):
+            self.check_applied(self.post(body.encode(), content_type='application/x-ndjson'))
+
+    def test_json_array_read_in_small_chunks(self):
+        body = json.dumps(self.OPERATIONS, ensure_ascii=False, indent=1)
+        with mock.patch.object(bulk, 'READ_SIZE', 5):
+            self.check_applied(self.post(body.encode()))
+
+    def test_partial_upsert_keeps_omitted_fields(self):
+        Country.objects.filter(name='Togo').update(capital='Lomé', region='Africa')
+        response = self.post(json.dumps([{'name': 'togo', 'population': 9, 'currency_code': 'XOF'}]))
+        self.assertEqual(response.json()['updated'], 1, response.content)
+        togo = Country.objects.get(name='togo')
+        self.assertEqual((togo.capital, togo.region, togo.population), ('Lomé', 'Africa', 9))
+
+    def test_invalid_payloads_write_nothing(self):
+        for body in ('{"name": "Ghana"}', '[{"name": "Ghana", "population": 1, "currency_code": "GHS"}',
+                     '[1] 2', ''):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()['error'], 'Invalid JSON')
+        self.assertEqual(Country.objects.count(), 2)
+
+    def test_size_limits(self):
+        body = json.dumps(self.OPERATIONS)
+        with override_settings(BULK_MAX_BYTES=len(body) - 1):
+            self.assertEqual(self.post(body).status_code, 413)
+            # Bodies without a Content-Length are cut off while they are read
+            with self.assertRaises(bulk.BulkError):
+                list(bulk.iter_json_array(io.BytesIO(body.encode())))
+        with override_settings(BULK_MAX_ITEMS=3):
+            response = self.post(body)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Country.objects.filter(name='Ghana').exists())
+
+
+class ExportImportTests(TestCase):
+    def setUp(self):
+        Country.objects.create(name='Côte d\'Ivoire', capital='Yamoussoukro, "Abidjan"', region='Africa',
+                               population=26378274, currency_code='XOF', exchange_rate=605.27,
+                               estimated_gdp=71123456.78, flag_url='https://flagcdn.com/ci.svg')
+        Country.objects.create(name='Antarctica', population=1000, currency_code=None)
+        Country.objects.create(name='Bitland', region='Line\nbreak', population=3, currency_code='XBT',
+                               exchange_rate=0.0000153, estimated_gdp=1.5e17)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def snapshot(self):
+        return list(Country.objects.order_by('name').values_list(
+            'name', 'capital', 'region', 'population', 'currency_code', 'exchange_rate', 'estimated_gdp', 'flag_url'))
+
+    def export(self, query):
+        response = self.client.get(f'/countries/export{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    @override_settings(LIST_STREAM_CHUNK_SIZE=2)
+    def test_export_formats(self):
+        response, body = self.export('')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = Country.objects.order_by('pk').values_list(*encoders.FIELDS)
+        self.assertEqual(body, b''.join(encoders.encode_country(row) + b'\n' for row in rows))
+
+        response, body = self.export('?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('countries.csv', response['Content-Disposition'])
+        self.assertTrue(body.startswith(b'id,name,capital,'))
+        response = self.client.get('/countries/export', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        _, body = self.export('?format=csv&region=antarctica')
+        self.assertEqual(body.count(b'\n'), 1)
+
+    @override_settings(LIST_STREAM_CHUNK_SIZE=2)
+    def test_round_trip(self):
+        expected = self.snapshot()
+        for fmt in ('ndjson', 'csv'):
+            path = os.path.join(self.tmp, f'countries.{fmt}')
+            with open(path, 'wb') as f:
+                f.write(self.export(f'?format={fmt}')[1])
+            Country.objects.all().delete()
+            out = io.StringIO()
+            call_command('import_countries', path, '--batch-size', '2', stdout=out)
+            self.assertIn('inserted=3', out.getvalue())
+            self.assertEqual(self.snapshot(), expected)
+            self.assertEqual(get_stats().total_countries, 3)
+
+    def test_bad_line_imports_nothing(self):
+        path = os.path.join(self.tmp, 'bad.ndjson')
+        with open(path, 'w') as f:
+            f.write('{"name": "Ghana", "population": 1, "currency_code": "GHS"}\n{oops\n')
+        with self.assertRaisesMessage(CommandError, 'line 2'):
+            call_command('import_countries', path, '--batch-size', '1')
+        self.assertFalse(Country.objects.filter(name='Ghana').exists())
+
+    def test_invalid_row_imports_nothing(self):
+        path = os.path.join(self.tmp, 'bad.ndjson')
+        for row, message in (('{"name": 123}', 'name must be a string'),
+                             ('{"name": "Togo", "population": "lots"}', 'population must be a number'),
+                             ('{"name": "Togo", "estimated_gdp": true}', 'estimated_gdp must be a number')):
+            with open(path, 'w') as f:
+                f.write('{"name": "Ghana", "population": 1, "currency_code": "GHS"}\n\n' + row + '\n')
+            with self.assertRaisesMessage(CommandError, f'{path}: line 3: {message}'):
+                call_command('import_countries', path)
+        self.assertFalse(Country.objects.filter(name='Ghana').exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        registry.reset()
+        Country.objects.create(name='Nigeria', population=1, currency_code='NGN')
+
+    def metrics(self):
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_requests_are_recorded_per_view(self):
+        first = self.client.get('/countries')
+        second = self.client.get('/countries')
+        self.assertRegex(first['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", cache;desc="list-miss"$')
+        self.assertIn('cache;desc="list-hit"', second['Server-Timing'])
+        self.client.get('/countries/nigeria')
+        self.client.get('/countries/atlantis')
+        b''.join(self.client.get('/countries/export').streaming_content)
+
+        lines = self.metrics()
+        self.assertIn('http_requests_total{view="list",method="GET",status="200"} 2', lines)
+        self.assertIn('http_requests_total{view="retrieve",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{view="list",method="GET"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="list",method="GET",le="+Inf"} 2', lines)
+        self.assertIn('cache_lookups_total{view="list",cache="list",result="hit"} 1', lines)
+        self.assertIn(f'http_response_size_bytes_total{{view="list",method="GET"}} {len(first.content) * 2}', lines)
+        export_queries = [line for line in lines if line.startswith('db_queries_total{view="export"')]
+        self.assertEqual(export_queries, ['db_queries_total{view="export",method="GET"} 2'])
+        self.assertIn('list_cache_entries 1', lines)
+
+    def test_unknown_methods_share_one_series(self):
+        self.client.generic('FROB', '/countries')
+        self.client.generic('PURGE', '/countries')
+        lines = self.metrics()
+        self.assertIn('http_request_duration_seconds_count{view="unknown",method="other"} 2', lines)
+        self.assertFalse([line for line in lines if 'FROB' in line or 'PURGE' in line])
+
+    def test_label_values_are_escaped(self):
+        registry.observe('a"b\\c\nd', 'GET', 200, 0.01, 0, RequestStats())
+        self.assertIn('http_requests_total{view="a\\"b\\\\c\\nd",method="GET",status="200"} 1', self.metrics())
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_can_be_disabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        upsert_countries(build_records(COUNTRIES_PAYLOAD, RATES_PAYLOAD['rates'], seed=1))
+        self.factory = AsyncRequestFactory()
+
+    async def test_responses_match_the_drf_views(self):
+        cases = [
+            ('/status', async_views.status, {}),
+            ('/countries?region=africa&sort=gdp_desc', async_views.country_list, {}),
+            ('/countries/NIGERIA', async_views.country_detail, {'name': 'NIGERIA'}),
+            ('/countries/atlantis', async_views.country_detail, {'name': 'atlantis'}),
+        ]
+        for url, view, kwargs in cases:
+            expected = await sync_to_async(self.client.get)(url)
+            response = await view(self.factory.get(url), **kwargs)
+            self.assertEqual(response.status_code, expected.status_code, url)
+            self.assertEqual(response.content, expected.content, url)
+            self.assertEqual(response.get('ETag'), expected.get('ETag'), url)
+
+        etag = (await async_views.country_detail(self.factory.get('/'), name='ghana'))['ETag']
+        not_modified = await async_views.country_detail(self.factory.get('/', headers={'If-None-Match': etag}), name='ghana')
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_streamed_list_matches(self):
+        expected = await sync_to_async(lambda: b''.join(self.client.get('/countries?stream=1').streaming_content))()
+        response = await async_views.country_list(self.factory.get('/countries?stream=1'))
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), expected)
+
+    async def test_other_requests_go_to_the_drf_view(self):
+        calls = []
+
+        def sync_view(request, **kwargs):
+            calls.append(request.method)
+            return HttpResponse(b'sync')
+
+        [pattern] = async_views.use_async_views([path('countries/<str:name>', sync_view, name='country-detail-no-slash')])
+        view = pattern.callback
+        self.assertEqual((await view(self.factory.get('/'), name='ghana'))['Content-Type'], 'application/json')
+        await view(self.factory.delete('/'), name='ghana')
+        await view(self.factory.get('/', headers={'Accept': 'text/html'}), name='ghana')
+        await view(self.factory.get('/'), name='ghana', format='api')
+        self.assertEqual(calls, ['DELETE', 'GET', 'GET'])
+
+    async def test_metrics_follow_queries_into_the_orm_thread(self):
+        async def get_response(request):
+            return await async_views.country_detail(request, name='ghana')
+
+        response = await MetricsMiddleware(get_response)(self.factory.get('/countries/ghana'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class SearchTests(TestCase):
+    COUNTRIES = [
+        ("Côte d'Ivoire", 'Yamoussoukro'), ('Nigeria', 'Abuja'), ('Niger', 'Niamey'),
+        ('United Kingdom', 'London'), ('Ghana', 'Accra'),
+    ]
+
+    def setUp(self):
+        search_index.clear()
+        self.addCleanup(search_index.clear)
+        for name, capital in self.COUNTRIES:
+            Country.objects.create(name=name, capital=capital, population=1, currency_code='XXX')
+        countries_changed()
+
+    def names(self, query, **params):
+        response = self.client.get('/countries/search', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [country['name'] for country in response.json()]
+
+    def test_prefix_matches_ignore_case_and_accents(self):
+        self.assertEqual(self.names('NIG'), ['Niger', 'Nigeria'])
+        self.assertEqual(self.names('cote d i'), ["Côte d'Ivoire"])
+        self.assertEqual(self.names('accr'), ['Ghana'])
+        self.assertEqual(self.names('kingdom'), ['United Kingdom'])
+
+    def test_name_matches_rank_before_capital_and_fuzzy_matches(self):
+        self.assertEqual(self.names('ni'), ['Niger', 'Nigeria'])
+        self.assertEqual(self.names('niam'), ['Niger'])
+        self.assertEqual(self.names('nigera'), ['Niger', 'Nigeria'])
+        self.assertEqual(self.names('yamousokro'), ["Côte d'Ivoire"])
+        self.assertEqual(self.names('zzz'), [])
+
+    def test_limit_is_bounded(self):
+        self.assertEqual(len(self.names('n', limit=1)), 1)
+        self.assertEqual(self.client.get('/countries/search', {'q': 'n', 'limit': 500}).status_code, 400)
+        self.assertEqual(self.client.get('/countries/search', {'q': ' '}).json()['details'], {'q': 'is required'})
+
+    def test_index_is_rebuilt_after_writes(self):
+        self.assertEqual(self.names('gha'), ['Ghana'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('ghan'), ['Ghana'])
+        self.client.post('/countries', {'name': 'Ghanaland', 'population': 2, 'currency_code': 'GHS'})
+        self.assertEqual(self.names('gha'), ['Ghana', 'Ghanaland'])
+
+    async def test_async_view_matches(self):
+        url = '/countries/search?q=nig&limit=5'
+        expected = await sync_to_async(self.client.get)(url)
+        response = await async_views.country_search(AsyncRequestFactory().get(url))
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+
+class ConnectionPoolTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.addCleanup(close_pools)
+        self.settings_dict = {
+            'ENGINE': 'countries.db.sqlite3', 'NAME': os.path.join(self.tmp, 'pool.sqlite3'),
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None,
+            'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+            'POOL': {'SIZE': 1, 'TIMEOUT': 0.05},
+        }
+
+    def wrapper(self):
+        return load_backend('countries.db.sqlite3').DatabaseWrapper(self.settings_dict, 'pool-test')
+
+    def test_closed_connections_are_reused(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(second.connection, raw)
+        self.assertEqual((second.pool.created, second.pool.reused), (1, 1))
+        second.close()
+
+    def test_pool_size_is_a_limit(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.wrapper().ensure_connection()
+        first.close()
+        self.wrapper().ensure_connection()
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        first = self.wrapper()
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x integer)')
+        first.set_autocommit(False)
+        with first.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        first.close()
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertTrue(second.get_autocommit())
+        second.close()
+
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        Country.objects.create(name='Côte d\'Ivoire', capital='Yamoussoukro', region='Africa', population=26378274,
+                               currency_code='XOF', exchange_rate=605.27, estimated_gdp=71123456.78,
+                               flag_url='https://flagcdn.com/ci.svg')
+        Country.objects.create(name='Antarctica', population=1000, currency_code=None)
+
+    @override_settings(LIST_STREAM_CHUNK_SIZE=1)
+    def test_stream_matches_serializer_output(self):
+        for query in ('', '?sort=gdp_desc', '?region=africa'):
+            expected = self.client.get(f'/countries{query}').content
+            response = self.client.get(f'/countries{query}{"&" if query else "?"}stream=1')
+            self.assertTrue(response.streaming)
+            self.assertEqual(b''.join(response.streaming_content), expected)
+
+    def test_serializer_fast_path_matches_field_dispatch(self):
+        Country.objects.create(name='Bitland', population=1, currency_code='XBT', exchange_rate=0.0000153)
+        for country in Country.objects.all():
+            fast = CountrySerializer(country).data
+            self.assertEqual(fast, serializers.ModelSerializer.to_representation(CountrySerializer(), country))
+        # Float columns keep small rates that DECIMAL(20, 2) rounded to 0.00
+        self.assertEqual(CountrySerializer(Country.objects.get(name='Bitland')).data['exchange_rate'], 0.0000153)
+
+    def test_empty_stream(self):
+        Country.objects.all().delete()
+        response = self.client.get('/countries?stream=1')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class EncoderParityTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        Country.objects.create(name='Côte d\'Ivoire', capital='Yamoussoukro', region='Africa', population=26378274,
+                               currency_code='XOF', exchange_rate=605.27, estimated_gdp=71123456.78,
+                               flag_url='https://flagcdn.com/ci.svg')
+        Country.objects.create(name='Antarctica', population=0, currency_code=None, estimated_gdp=0.0)
+        Country.objects.create(name='Quote "\\ \u2028\u2029 \x01\t 😀', capital='', population=10 ** 18,
+                               currency_code='XBT', exchange_rate=0.0000153, estimated_gdp=1.5e17)
+        Country.objects.create(name='Round', population=7, currency_code='USD', exchange_rate=1.0,
+                               estimated_gdp=1e15)
+        # One timestamp with microseconds and one without
+        Country.objects.filter(name='Round').update(
+            last_refreshed_at=timezone.now().replace(microsecond=0))
+
+    def expected(self, queryset):
+        return JSONRenderer().render(CountrySerializer(queryset, many=True).data)
+
+    def check_parity(self):
+        queryset = Country.objects.all()
+        self.assertEqual(encoders.encode_countries(queryset.values_list(*encoders.FIELDS)), self.expected(queryset))
+        for country in queryset:
+            row = Country.objects.filter(pk=country.pk).values_list(*encoders.FIELDS).get()
+            self.assertEqual(encoders.encode_country(row), JSONRenderer().render(CountrySerializer(country).data))
+        # Rows whose floats orjson formats differently fall back without affecting the rest
+        plain = queryset.exclude(name__startswith='Quote')
+        self.assertEqual(encoders.encode_countries(plain.values_list(*encoders.FIELDS)), self.expected(plain))
+
+    def test_matches_json_renderer(self):
+        with mock.patch.object(encoders, '_use_orjson', False):
+            self.check_parity()
+
+    def test_matches_json_renderer_with_orjson(self):
+        if encoders.orjson is None:
+            self.skipTest('orjson is not installed')
+        self.check_parity()
+
+    def test_read_endpoints(self):
+        queryset = Country.objects.all()
+        self.assertEqual(self.client.get('/countries').content, self.expected(queryset))
+        country = queryset.get(name='Round')
+        response = self.client.get('/countries/round')
+        self.assertEqual(response.content, JSONRenderer().render(CountrySerializer(country).data))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(self.client.get('/countries/nowhere').status_code, 404)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        list_cache.clear()
+        self.addCleanup(list_cache.clear)
+        for i, gdp in enumerate([500, 300, 300, None, 300, 100, None]):
+            Country.objects.create(name=f'Country {i}', region='Africa', population=1,
+                                   currency_code='NGN', estimated_gdp=gdp)
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [country['name'] for country in response.json()['results']]
+            url = response.json()['next']
+        return names
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for query in ('', '&sort=gdp_desc', '&region=africa&sort=gdp_desc'):
+            expected = [country['name'] for country in self.client.get(f'/countries?x=1{query}').json()]
+            if 'gdp_desc' in query:
+                # Ties on GDP are broken by id, newest first; NULLs come last
+                expected = list(Country.objects.order_by(F('estimated_gdp').desc(nulls_last=True), '-id')
+                                .values_list('name', flat=True))
+                self.assertEqual(expected[-2:], ['Country 6', 'Country 3'])
+            self.assertEqual(self.walk(f'/countries?limit=2{query}'), expected)
+
+    def test_gdp_sort_uses_index(self):
+        self.assertIn('country_gdp_idx', Country.objects.order_by('-estimated_gdp', '-id').explain())
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/countries?cursor=garbage').status_code, 400)
+        self.assertEqual(self.client.get('/countries?limit=0').status_code, 400)
+
+
+@override_settings(BASE_DIR=Path(tempfile.gettempdir()) / 'countries-summary-test')
+class SummaryImageTests(TestCase):
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, settings.BASE_DIR, ignore_errors=True)
+        Country.objects.create(name='Nigeria', population=1, currency_code='NGN', estimated_gdp=1000)
+
+    def test_render_is_skipped_when_inputs_unchanged(self):
+        self.assertTrue(summary.generate_summary_image())
+        self.assertFalse(summary.generate_summary_image())
+        Country.objects.create(name='Ghana', population=1, currency_code='GHS', estimated_gdp=10)
+        countries_changed()
+        self.assertTrue(summary.generate_summary_image())
+        self.assertFalse(any(name.endswith('.tmp') for name in os.listdir(settings.BASE_DIR / 'cache')))
+
+    def test_image_variants_are_served(self):
+        summary.generate_summary_image()
+        png = self.client.get('/countries/image')
+        self.assertEqual(png['Content-Type'], 'image/png')
+        webp = self.client.get('/countries/image', HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertIn('Accept', webp['Vary'])
+
+    def test_range_and_conditional_requests(self):
+        summary.generate_summary_image()
+        full = self.client.get('/countries/image')
+        data = full.content
+        etag = full.headers['ETag']
+        self.assertEqual(full.headers['Accept-Ranges'], 'bytes')
+
+        partial = self.client.get('/countries/image', HTTP_RANGE='bytes=0-9')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.content, data[:10])
+        self.assertEqual(partial.headers['Content-Range'], f'bytes 0-9/{len(data)}')
+        self.assertEqual(self.client.get('/countries/image', HTTP_RANGE='bytes=-5').content, data[-5:])
+        self.assertEqual(self.client.get('/countries/image', HTTP_RANGE=f'bytes={len(data)}-').status_code, 416)
+        stale = self.client.get('/countries/image', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+
+        self.assertEqual(self.client.get('/countries/image', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(SUMMARY_IMAGE_SERVE='x-accel-redirect', SUMMARY_IMAGE_ACCEL_PREFIX='/internal/')
+    def test_x_accel_redirect(self):
+        summary.generate_summary_image()
+        response = self.client.get('/countries/image')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/summary.png')
+        self.assertEqual(response.content, b'')
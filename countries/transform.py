@@ -0,0 +1,109 @@
+"""
+Refresh transform stage: raw upstream JSON in, Country field dicts out.
+
+Exchange rates are parsed once per currency and estimated GDP is computed over whole
+columns at once, with NumPy when it is installed and a single list pass otherwise.
+Nothing here touches the database.
+"""
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GDP_MULTIPLIER_RANGE = (1000, 2000)
+
+
+def make_rng(seed=None):
+    """RNG for the GDP multipliers; pass a seed for reproducible output."""
+    if np is not None:
+        return np.random.default_rng(seed)
+    return random.Random(seed)
+
+
+def _parse_rate(value):
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+
+def _currency_code(currencies):
+    if currencies and isinstance(currencies[0], dict):
+        return currencies[0].get('code')
+    return None
+
+
+def compute_gdp(populations, exchange_rates, no_currency, rng):
+    """
+    estimated_gdp = population * uniform(1000, 2000) / exchange_rate over whole columns.
+
+    `exchange_rates` holds None where there is no usable rate. Rows with no rate, or a
+    zero population or rate, get None; rows whose country lists no currency get 0.
+    """
+    low, high = GDP_MULTIPLIER_RANGE
+    n = len(populations)
+    if np is not None:
+        population = np.array(populations, dtype=np.float64)
+        # None becomes NaN in a float array
+        rate = np.array(exchange_rates, dtype=np.float64)
+        multiplier = rng.uniform(low, high, n)
+        valid = (population != 0) & (rate != 0) & ~np.isnan(rate)
+        gdp = np.zeros(n)
+        np.divide(population * multiplier, rate, out=gdp, where=valid)
+        result = gdp.tolist()
+        # Rows left at zero that do have a currency are unknown, not zero
+        for i in np.flatnonzero(~valid & ~np.array(no_currency, dtype=bool)).tolist():
+            result[i] = None
+        return result
+
+    # random() is a C call; uniform() is a Python wrapper around it
+    draw = rng.random
+    span = high - low
+    return [
+        0 if missing else (population * (low + span * draw()) / rate if population and rate else None)
+        for population, rate, missing in zip(populations, exchange_rates, no_currency)
+    ]
+
+
+def build_records(countries_data, rates, seed=None, rng=None):
+    """
+    Turn the raw restcountries payload into Country field dicts.
+
+    One pass builds the records and the population / exchange-rate columns; estimated_gdp
+    is then computed for all rows at once and filled in.
+    """
+    # Rates are parsed once per currency, not once per country
+    parsed_rates = {code: _parse_rate(value) for code, value in rates.items()}
+    records = []
+    populations = []
+    exchange_rates = []
+    no_currency = []
+    for country_data in countries_data:
+        name = country_data.get('name')
+        if not name:
+            continue
+        currencies = country_data.get('currencies')
+        currency_code = _currency_code(currencies)
+        exchange_rate = parsed_rates.get(currency_code) if currency_code else None
+        population = country_data.get('population') or 0
+
+        populations.append(population)
+        exchange_rates.append(exchange_rate)
+        no_currency.append(not currencies)
+        records.append({
+            'name': name,
+            'capital': country_data.get('capital'),
+            'region': country_data.get('region'),
+            'population': population,
+            'currency_code': currency_code,
+            'exchange_rate': exchange_rate,
+            'estimated_gdp': None,
+            'flag_url': country_data.get('flag'),
+        })
+
+    gdp = compute_gdp(populations, exchange_rates, no_currency, rng or make_rng(seed))
+    for record, estimated_gdp in zip(records, gdp):
+        record['estimated_gdp'] = estimated_gdp
+    return records
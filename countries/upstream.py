@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from urllib.parse import unquote, urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Setting holding each source's URL (or file path); see source_location()
+SOURCES = {'countries': 'COUNTRIES_API_URL', 'rates': 'EXCHANGE_RATES_API_URL'}
+
+_session = None
+_session_lock = threading.Lock()
+_fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upstream-fetch')
+
+
+class UpstreamError(Exception):
+    """One of the external data sources could not be fetched."""
+
+    def __init__(self, details):
+        super().__init__(details)
+        self.details = details
+
+
+class CachedResponse:
+    """
+    An upstream response body plus the validators needed to revalidate it.
+
+    Entries live as one JSON file per source under UPSTREAM_CACHE_DIR. `changed` is set
+    when the body differs from what was cached, i.e. the DB pass has something to do.
+    """
+
+    def __init__(self, source, url, body, digest, etag=None, last_modified=None,
+                 next_update=None, fetched_at=None, changed=True):
+        self.source = source
+        self.url = url
+        self.body = body
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.next_update = next_update
+        self.fetched_at = fetched_at or time.time()
+        self.changed = changed
+
+    @staticmethod
+    def path(source):
+        return os.path.join(settings.UPSTREAM_CACHE_DIR, f'{source}.json')
+
+    @classmethod
+    def load(cls, source, url):
+        try:
+            with open(cls.path(source)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            # Source was repointed; the cached body says nothing about the new one
+            return None
+        entry.pop('url')
+        return cls(source, url, changed=False, **entry)
+
+    def save(self):
+        os.makedirs(settings.UPSTREAM_CACHE_DIR, exist_ok=True)
+        entry = {
+            'url': self.url,
+            'body': self.body,
+            'digest': self.digest,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'next_update': self.next_update,
+            'fetched_at': self.fetched_at,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=settings.UPSTREAM_CACHE_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path(self.source))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def is_fresh(self, now=None):
+        now = now or time.time()
+        if self.next_update and now < self.next_update:
+            # er-api tells us when the next rates table is published
+            return True
+        return now < self.fetched_at + settings.UPSTREAM_CACHE_TTL
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.UPSTREAM_RETRIES,
+        backoff_factor=settings.UPSTREAM_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Process-wide keep-alive session shared by all refreshes."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def source_location(source, snapshot_dir=None):
+    """
+    Where `source` ('countries' or 'rates') is read from.
+
+    With a snapshot directory (argument or UPSTREAM_SNAPSHOT_DIR) that is `<dir>/<source>.json`;
+    otherwise the configured setting, which may be an http(s) URL, a file:// URL or a path.
+    """
+    snapshot_dir = snapshot_dir or settings.UPSTREAM_SNAPSHOT_DIR
+    if snapshot_dir:
+        return os.path.join(snapshot_dir, f'{source}.json')
+    return getattr(settings, SOURCES[source])
+
+
+def _local_path(location):
+    if location.startswith('file://'):
+        return unquote(urlsplit(location).path)
+    if '://' not in location:
+        return location
+    return None
+
+
+def _response(source, url, content, validate, cached, headers=None):
+    headers = headers or {}
+    body = json.loads(content)
+    validate(body)
+    digest = hashlib.sha256(content).hexdigest()
+    next_update = body.get('time_next_update_unix') if isinstance(body, dict) else None
+    return CachedResponse(
+        source, url, body, digest,
+        etag=headers.get('ETag'),
+        last_modified=headers.get('Last-Modified'),
+        next_update=next_update,
+        # Servers without validators still resend identical bodies; don't treat those as changes
+        changed=cached is None or cached.digest != digest,
+    )
+
+
+def _fetch(session, source, url, validate, force):
+    cached = None if force else CachedResponse.load(source, url)
+    path = _local_path(url)
+    if path is not None:
+        # Reading a file is cheap, so there's no TTL: the content is compared every time
+        with open(path, 'rb') as f:
+            return _response(source, url, f.read(), validate, cached)
+
+    if cached is not None and cached.is_fresh():
+        return cached
+
+    headers = cached.conditional_headers() if cached is not None else {}
+    resp = session.get(url, timeout=settings.UPSTREAM_TIMEOUT, headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        cached.fetched_at = time.time()
+        cached.etag = resp.headers.get('ETag', cached.etag)
+        cached.last_modified = resp.headers.get('Last-Modified', cached.last_modified)
+        return cached
+
+    resp.raise_for_status()
+    return _response(source, url, resp.content, validate, cached, resp.headers)
+
+
+def _validate_countries(body):
+    if not isinstance(body, list):
+        raise ValueError('countries payload is not a list')
+
+
+def _validate_rates(body):
+    if not isinstance(body, dict) or body.get('rates') is None:
+        raise ValueError('rates missing')
+
+
+def fetch_countries(session, force=False, snapshot_dir=None):
+    try:
+        return _fetch(session, 'countries', source_location('countries', snapshot_dir), _validate_countries, force)
+    except (requests.exceptions.RequestException, OSError, ValueError):
+        raise UpstreamError('Could not fetch data from countries API')
+
+
+def fetch_rates(session, force=False, snapshot_dir=None):
+    try:
+        return _fetch(session, 'rates', source_location('rates', snapshot_dir), _validate_rates, force)
+    except (requests.exceptions.RequestException, OSError, ValueError):
+        raise UpstreamError('Could not fetch data from exchange rates API')
+
+
+def fetch_upstream(force=False, snapshot_dir=None):
+    """
+    Fetch the countries payload and the exchange rates in parallel.
+
+    Returns the (countries, rates) CachedResponse pair; fresh cache entries are reused and
+    stale ones revalidated with a conditional GET unless `force` is set. Raises
+    UpstreamError as soon as either source fails, so callers can keep the all-or-nothing
+    behaviour without waiting on the slower one. Callers save() the responses once the
+    data has been applied. `snapshot_dir` reads both sources from files instead (see
+    source_location).
+    """
+    session = get_session()
+    countries_future = _fetch_pool.submit(fetch_countries, session, force, snapshot_dir)
+    rates_future = _fetch_pool.submit(fetch_rates, session, force, snapshot_dir)
+    wait([countries_future, rates_future], return_when=FIRST_EXCEPTION)
+    # Report the countries API first when both failed, matching the old sequential order
+    for future in (countries_future, rates_future):
+        if future.done() and future.exception() is not None:
+            raise future.exception()
+    return countries_future.result(), rates_future.result()
+
+
+def save_snapshot(snapshot_dir, countries_resp, rates_resp):
+    """Write fetched bodies as `<dir>/countries.json` and `<dir>/rates.json` for later replay."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for resp in (countries_resp, rates_resp):
+        with open(os.path.join(snapshot_dir, f'{resp.source}.json'), 'w', encoding='utf-8') as f:
+            json.dump(resp.body, f, ensure_ascii=False)
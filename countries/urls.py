@@ -14,14 +14,25 @@ urlpatterns = [
 country_list = CountryViewSet.as_view({'get': 'list', 'post': 'create'})
 country_detail = CountryViewSet.as_view({'get': 'retrieve', 'delete': 'destroy', 'put': 'update', 'patch': 'update'})
 country_refresh = CountryViewSet.as_view({'post': 'refresh'})
+country_bulk = CountryViewSet.as_view({'post': 'bulk'})
+# as_view() doesn't pick up @action options by itself; export needs its renderer_classes
+country_export = CountryViewSet.as_view({'get': 'export'}, **CountryViewSet.export.kwargs)
+country_refresh_job = CountryViewSet.as_view({'get': 'refresh_job'})
 country_image = CountryViewSet.as_view({'get': 'image'})
+country_search = CountryViewSet.as_view({'get': 'search'})
 country_status = CountryViewSet.as_view({'get': 'status'})
+country_stats = CountryViewSet.as_view({'get': 'stats'})
 
 # Additional URL patterns without trailing slashes
 urlpatterns += [
     path('countries', country_list, name='country-list-no-slash'),
     path('countries/refresh', country_refresh, name='country-refresh-no-slash'),
+    path('countries/bulk', country_bulk, name='country-bulk-no-slash'),
+    path('countries/export', country_export, name='country-export-no-slash'),
+    path('countries/refresh/<str:job_id>', country_refresh_job, name='country-refresh-job-no-slash'),
     path('countries/image', country_image, name='country-image-no-slash'),
+    path('countries/search', country_search, name='country-search-no-slash'),
     path('countries/status', country_status, name='country-status-no-slash'),
+    path('countries/stats', country_stats, name='country-stats-no-slash'),
     path('countries/<str:name>', country_detail, name='country-detail-no-slash'),
 ]
\ No newline at end of file
@@ -1,67 +1,138 @@
 import os
-import random
-from datetime import datetime
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from datetime import datetime, timezone as dt_timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.conf import settings
-from django.http import FileResponse, HttpResponse
-from .models import Country
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from .models import Country, RefreshJob
 from .serializers import CountrySerializer
+from .stats import countries_changed, get_stats
+from .jobs import refresh_now, submit_refresh
+from .metrics import registry
+from .bulk import BulkError, BulkWriter, parse_body
+from .export import FORMATS, CSVRenderer, NDJSONRenderer, export
+from .encoders import FIELDS, encode_countries, encode_country, stream_countries, to_dicts
+from .pagination import CountryKeysetPagination, InvalidPage
+from .search import normalize, parse_limit, search_index
+from .summary import read_summary, summary_path
+from .cache import (
+    conditional, get_data_version, list_cache, list_cache_key, make_etag, ranged_response,
+)
 import json
 
+
+def _flag(request, name):
+    return request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def filter_countries(query_params):
+    """Countries matching the ?region=, ?currency= and ?sort= list parameters."""
+    queryset = Country.objects.all()
+
+    # Filter by region
+    region = query_params.get('region', None)
+    if region:
+        queryset = queryset.by_region(region)
+
+    # Filter by currency
+    currency = query_params.get('currency', None)
+    if currency:
+        queryset = queryset.by_currency(currency)
+
+    # Sort by GDP
+    sort = query_params.get('sort', None)
+    if sort == 'gdp_desc':
+        # NULLs last on every backend, as keyset pages (and MySQL/SQLite by default) order them
+        queryset = queryset.order_by(F('estimated_gdp').desc(nulls_last=True))
+
+    return queryset
+
+
 class CountryViewSet(viewsets.ModelViewSet):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
     lookup_field = 'name'
     
     def get_queryset(self):
-        queryset = Country.objects.all()
-        
-        # Filter by region
-        region = self.request.query_params.get('region', None)
-        if region:
-            queryset = queryset.filter(region__iexact=region)
-            
-        # Filter by currency
-        currency = self.request.query_params.get('currency', None)
-        if currency:
-            queryset = queryset.filter(currency_code__iexact=currency)
-            
-        # Sort by GDP
-        sort = self.request.query_params.get('sort', None)
-        if sort == 'gdp_desc':
-            queryset = queryset.order_by('-estimated_gdp')
-            
-        return queryset
+        return filter_countries(self.request.query_params)
 
     def get_object(self):
-        return get_object_or_404(Country, name__iexact=self.kwargs['name'])
+        return get_object_or_404(Country.objects.by_name(self.kwargs['name']))
 
     def list(self, request, *args, **kwargs):
         """Return a plain list (not paginated) of countries to match required API contract."""
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        if request.accepted_renderer.format != 'json':
+            # Browsable API and other renderers go through the normal path
+            queryset = self.get_queryset()
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        key = list_cache_key(request.query_params)
+        generation, modified_at = get_data_version()
+        etag = make_etag('countries', generation, key)
+
+        if 'cursor' in request.query_params or 'limit' in request.query_params:
+            page_etag = make_etag('countries-page', generation, key,
+                                  request.query_params.get('cursor'), request.query_params.get('limit'))
+            return conditional(request, page_etag, modified_at, lambda: self.list_page(request))
+
+        if _flag(request, 'stream'):
+            # Large tables: encode rows as they come off the cursor instead of building the body
+            return conditional(request, etag, modified_at, lambda: StreamingHttpResponse(
+                stream_countries(self.get_queryset(), settings.LIST_STREAM_CHUNK_SIZE),
+                content_type='application/json',
+            ))
+
+        def render():
+            body = list_cache.get(key, generation)
+            if body is None:
+                body = encode_countries(self.get_queryset().values_list(*FIELDS))
+                list_cache.set(key, generation, body)
+            return HttpResponse(body, content_type='application/json')
+
+        return conditional(request, etag, modified_at, render)
+
+    def list_page(self, request):
+        """Keyset-paginated variant of list, used when ?cursor= or ?limit= is given."""
+        paginator = CountryKeysetPagination()
+        try:
+            page = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        except InvalidPage as e:
+            return Response({"error": "Validation failed", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, name=None):
-        country = Country.objects.filter(name__iexact=name).first()
-        if not country:
+        row = Country.objects.by_name(name).values_list(*FIELDS).first()
+        if not row:
             return Response({"error": "Country not found"}, status=status.HTTP_404_NOT_FOUND)
-        serializer = self.get_serializer(country)
-        return Response(serializer.data)
+        data = dict(zip(FIELDS, row))
+        # last_refreshed_at is bumped on every write to the row, so it versions the body
+        etag = make_etag('country', data['id'], data['last_refreshed_at'])
+
+        def render():
+            if request.accepted_renderer.format != 'json':
+                return Response(to_dicts([row])[0])
+            return HttpResponse(encode_country(row), content_type='application/json')
+
+        return conditional(request, etag, data['last_refreshed_at'], render)
 
     def destroy(self, request, name=None):
-        country = Country.objects.filter(name__iexact=name).first()
+        country = Country.objects.by_name(name).first()
         if not country:
             return Response({"error": "Country not found"}, status=status.HTTP_404_NOT_FOUND)
-        country.delete()
+        with transaction.atomic():
+            country.delete()
+            countries_changed()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def _validate_required_fields(self, data, partial=False):
@@ -84,12 +155,14 @@ class CountryViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         if not serializer.is_valid():
             return Response({"error": "Validation failed", "details": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
-        self.perform_create(serializer)
+        with transaction.atomic():
+            self.perform_create(serializer)
+            countries_changed()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, name=None, *args, **kwargs):
         partial = kwargs.pop('partial', False)
-        instance = Country.objects.filter(name__iexact=name).first()
+        instance = Country.objects.by_name(name).first()
         if not instance:
             return Response({"error": "Country not found"}, status=status.HTTP_404_NOT_FOUND)
         errors = self._validate_required_fields(request.data, partial=partial)
@@ -98,184 +171,182 @@ class CountryViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         if not serializer.is_valid():
             return Response({"error": "Validation failed", "details": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
-        serializer.save()
+        # Manual edits diverge from upstream; with no fingerprint the next refresh rewrites this
+        # row (the write bumps the generation, so that refresh runs its diff)
+        with transaction.atomic():
+            serializer.save(fingerprint=None)
+            countries_changed()
         return Response(serializer.data)
 
-    @action(detail=False, methods=['post'])
-    def refresh(self, request):
-        # Fetch external data first. If either external API fails, do not modify DB.
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Type-ahead: countries whose name or capital matches ?q=, best first, at most ?limit=."""
+        query = request.query_params.get('q', '')
         try:
-            countries_resp = requests.get(
-                'https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies',
-                timeout=15,
-            )
-            countries_resp.raise_for_status()
-            countries_data = countries_resp.json()
-        except requests.exceptions.RequestException:
-            return Response({"error": "External data source unavailable", "details": "Could not fetch data from countries API"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            limit = parse_limit(request.query_params.get('limit'))
+        except ValueError as e:
+            return Response({"error": "Validation failed", "details": {"limit": str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+        if not normalize(query):
+            return Response({"error": "Validation failed", "details": {"q": "is required"}}, status=status.HTTP_400_BAD_REQUEST)
+        generation, modified_at = get_data_version()
+        etag = make_etag('search', generation, normalize(query), limit)
+
+        def render():
+            rows = search_index.get(generation).search(query, limit)
+            if request.accepted_renderer.format != 'json':
+                return Response(to_dicts(rows))
+            return HttpResponse(encode_countries(rows), content_type='application/json')
+
+        return conditional(request, etag, modified_at, render)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer, JSONRenderer])
+    def export(self, request):
+        """Stream the (filtered) table as NDJSON or CSV; ?format=ndjson|csv or the Accept header picks."""
+        fmt = request.accepted_renderer.format
+        if fmt not in FORMATS:
+            fmt = 'ndjson'
+        response = StreamingHttpResponse(
+            export(fmt, self.get_queryset(), settings.LIST_STREAM_CHUNK_SIZE), content_type=FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="countries.{fmt}"'
+        return response
 
-        try:
-            exchange_resp = requests.get('https://open.er-api.com/v6/latest/USD', timeout=15)
-            exchange_resp.raise_for_status()
-            exchange_json = exchange_resp.json()
-            rates = exchange_json.get('rates')
-            if rates is None:
-                raise ValueError('rates missing')
-        except (requests.exceptions.RequestException, ValueError):
-            return Response({"error": "External data source unavailable", "details": "Could not fetch data from exchange rates API"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-
-        # Both external APIs are OK — proceed to update DB inside a transaction
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Apply a JSON array or NDJSON body of upsert/delete operations in one transaction."""
+        length = request.META.get('CONTENT_LENGTH')
+        if length and length.isdigit() and int(length) > settings.BULK_MAX_BYTES:
+            return Response({"error": "Payload too large", "details": f'limit is {settings.BULK_MAX_BYTES} bytes'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        writer = BulkWriter(self._validate_required_fields)
         try:
             with transaction.atomic():
-                for country_data in countries_data:
-                    name = country_data.get('name')
-                    if not name:
-                        continue
-
-                    currencies = country_data.get('currencies') or []
-                    currency_code = None
-                    if len(currencies) > 0 and currencies[0]:
-                        currency_code = currencies[0].get('code') if isinstance(currencies[0], dict) else None
-
-                    exchange_rate = None
-                    estimated_gdp = None
-
-                    population = country_data.get('population') or 0
-
-                    if not currencies:
-                        # Spec: if currencies array is empty, set currency_code null, exchange_rate null, estimated_gdp 0
-                        currency_code = None
-                        exchange_rate = None
-                        estimated_gdp = 0
-                    else:
-                        if currency_code and currency_code in rates:
-                            try:
-                                exchange_rate = float(rates[currency_code])
-                            except Exception:
-                                exchange_rate = None
-
-                            if population and exchange_rate:
-                                multiplier = random.uniform(1000, 2000)
-                                estimated_gdp = (population * multiplier) / exchange_rate
-                        else:
-                            # currency present but not found in rates
-                            exchange_rate = None
-                            estimated_gdp = None
-
-                    # Match existing by name case-insensitive
-                    existing = Country.objects.filter(name__iexact=name).first()
-                    if existing:
-                        existing.capital = country_data.get('capital')
-                        existing.region = country_data.get('region')
-                        existing.population = population
-                        existing.currency_code = currency_code
-                        existing.exchange_rate = exchange_rate
-                        existing.estimated_gdp = estimated_gdp
-                        existing.flag_url = country_data.get('flag')
-                        # auto_now will update last_refreshed_at on save
-                        existing.save()
-                    else:
-                        Country.objects.create(
-                            name=name,
-                            capital=country_data.get('capital'),
-                            region=country_data.get('region'),
-                            population=population,
-                            currency_code=currency_code,
-                            exchange_rate=exchange_rate,
-                            estimated_gdp=estimated_gdp,
-                            flag_url=country_data.get('flag')
-                        )
-
-            # Generate summary image
-            self.generate_summary_image()
-
-            last_ref = Country.objects.order_by('-last_refreshed_at').first()
-            last_refreshed_at = last_ref.last_refreshed_at if last_ref else None
+                for index, item in enumerate(parse_body(request)):
+                    writer.add(index, item)
+                writer.flush()
+                if writer.changed:
+                    countries_changed()
+        except BulkError as e:
+            return Response({"error": e.message, "details": e.details}, status=e.status_code)
+        return Response(writer.summary())
 
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        force = _flag(request, 'force')
+        if _flag(request, 'async'):
+            job, created = submit_refresh(force=force)
             return Response({
-                'message': 'Countries data refreshed successfully',
-                'total_countries': Country.objects.count(),
-                'last_refreshed_at': last_refreshed_at,
-            })
-        except Exception as e:
-            return Response({'error': 'Internal server error', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'job_id': job.pk,
+                'status': job.status,
+                'coalesced': not created,
+                'status_url': request.build_absolute_uri(f'/countries/refresh/{job.pk}'),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        # Shares the single-flight lock with async refreshes: overlapping calls wait for one run
+        status_code, body = refresh_now(force=force)
+        return Response(body, status=status_code)
+
+    @action(detail=False, methods=['get'], url_path=r'refresh/(?P<job_id>[0-9a-fA-F-]{36})')
+    def refresh_job(self, request, job_id=None):
+        try:
+            job = RefreshJob.objects.filter(pk=job_id).first()
+        except ValidationError:
+            # Not a UUID (the no-slash route accepts any string)
+            job = None
+        if not job:
+            return Response({"error": "Refresh job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'job_id': job.pk,
+            'status': job.status,
+            'stage': job.stage,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'status_code': job.status_code,
+            'result': job.result,
+        })
 
     @action(detail=False, methods=['get'])
     def status(self, request):
-        total_countries = Country.objects.count()
-        last_refreshed = Country.objects.order_by('-last_refreshed_at').first()
-        last_refreshed_at = last_refreshed.last_refreshed_at if last_refreshed else None
+        stats = get_stats()
+        return Response({
+            'total_countries': stats.total_countries,
+            'last_refreshed_at': stats.last_refreshed_at,
+            'list_cache': list_cache.stats(),
+        })
 
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        stats = get_stats()
         return Response({
-            'total_countries': total_countries,
-            'last_refreshed_at': last_refreshed_at
+            'total_countries': stats.total_countries,
+            'last_refreshed_at': stats.last_refreshed_at,
+            'top_by_gdp': stats.top_by_gdp,
+            'by_region': stats.by_region,
+            'by_currency': stats.by_currency,
+            'updated_at': stats.updated_at,
         })
 
     @action(detail=False, methods=['get'])
     def image(self, request):
-        image_path = os.path.join(settings.BASE_DIR, 'cache', 'summary.png')
-        if not os.path.exists(image_path):
+        # Browsers that advertise WebP get the smaller variant
+        ext = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'png'
+        content_type = f'image/{ext}'
+        image_path = summary_path(ext)
+        mode = settings.SUMMARY_IMAGE_SERVE
+        try:
+            if mode == 'memory':
+                version, data = read_summary(ext)
+            else:
+                stat = os.stat(image_path)
+                version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
             return Response({
                 'error': 'Summary image not found'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        return FileResponse(open(image_path, 'rb'), content_type='image/png')
+        etag = make_etag('summary', ext, *version)
+        modified_at = datetime.fromtimestamp(version[0] / 1e9, tz=dt_timezone.utc)
 
-    def generate_summary_image(self):
-        # Ensure cache directory exists
-        cache_dir = os.path.join(settings.BASE_DIR, 'cache')
-        os.makedirs(cache_dir, exist_ok=True)
+        def render():
+            if mode == 'memory':
+                return ranged_response(request, data, content_type, etag)
+            # Let the front-end server send the file with sendfile(2); it also handles Range
+            response = HttpResponse(content_type=content_type)
+            if mode == 'x-accel-redirect':
+                response.headers['X-Accel-Redirect'] = settings.SUMMARY_IMAGE_ACCEL_PREFIX + os.path.basename(image_path)
+            else:
+                response.headers['X-Sendfile'] = image_path
+            return response
 
-        # Create image
-        width = 800
-        height = 600
-        image = Image.new('RGB', (width, height), color='white')
-        draw = ImageDraw.Draw(image)
-
-        try:
-            # Try to load a system font
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-        except:
-            # Fallback to default font
-            font = ImageFont.load_default()
-
-        # Draw content
-        y_position = 50
-        
-        # Total countries
-        total_countries = Country.objects.count()
-        draw.text((50, y_position), f'Total Countries: {total_countries}', fill='black', font=font)
-        y_position += 50
-
-        # Top 5 countries by GDP
-        draw.text((50, y_position), 'Top 5 Countries by GDP:', fill='black', font=font)
-        y_position += 40
-
-        top_countries = Country.objects.filter(
-            estimated_gdp__isnull=False
-        ).order_by('-estimated_gdp')[:5]
-
-        for country in top_countries:
-            gdp_text = f'{country.name}: ${country.estimated_gdp:,.2f}'
-            draw.text((70, y_position), gdp_text, fill='black', font=font)
-            y_position += 30
-
-        # Last refresh timestamp
-        y_position += 20
-        last_refresh = datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')
-        draw.text((50, y_position), f'Last Refreshed: {last_refresh}', fill='black', font=font)
-
-        # Save image
-        image.save(os.path.join(cache_dir, 'summary.png'))
+        response = conditional(request, etag, modified_at, render)
+        patch_vary_headers(response, ['Accept'])
+        return response
 
 
 @api_view(['GET'])
 def status_view(request):
     """Top-level status endpoint expected at /status"""
-    total_countries = Country.objects.count()
-    last_refreshed = Country.objects.order_by('-last_refreshed_at').first()
-    last_refreshed_at = last_refreshed.last_refreshed_at if last_refreshed else None
+    stats = get_stats()
     return Response({
-        'total_countries': total_countries,
-        'last_refreshed_at': last_refreshed_at
+        'total_countries': stats.total_countries,
+        'last_refreshed_at': stats.last_refreshed_at,
+        'list_cache': list_cache.stats(),
     })
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this worker's request metrics."""
+    if not settings.METRICS_ENABLED:
+        return HttpResponse(status=404)
+    lines = registry.render()
+    cache_stats = list_cache.stats()
+    lines += [
+        '# HELP list_cache_entries Rendered GET /countries bodies held by this worker.',
+        '# TYPE list_cache_entries gauge',
+        f'list_cache_entries {cache_stats["entries"]}',
+        '# HELP list_cache_bytes Size of the rendered bodies held by this worker.',
+        '# TYPE list_cache_bytes gauge',
+        f'list_cache_bytes {cache_stats["bytes"]}',
+    ]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')